@@ -8,9 +8,25 @@ Easily draw high quality board game diagrams.
 
 
 import argparse
+import base64
+import collections
+import contextlib
+import functools
+import hashlib
+import html
+import io
+import itertools
+import json
+import mmap
 import os
 import re
+import shlex
+import shutil
+import struct
 import sys
+import threading
+import time
+import zlib
 
 from argparse import ArgumentParser
 
@@ -28,14 +44,27 @@ def errln(line):
 
 
 # Non-builtin imports:
+# (Pillow is imported on first use, so that work that doesn't draw
+# anything, such as render cache hits, doesn't pay for it. The same goes
+# for the standard modules only needed by the server, parallel rendering,
+# batches and threads, which are imported where they are used)
 
-try:
-    from PIL import Image, ImageDraw, ImageFont
+Image = ImageChops = ImageColor = ImageDraw = ImageFont = None
 
-except ImportError:
-    errln('Tileboard requires the following modules:')
-    errln('Pillow 3.0.0+ - <https://pypi.python.org/pypi/Pillow>')
-    sys.exit(1)
+
+def import_pillow():
+    """ Import the Pillow modules Tileboard needs, unless already imported. """
+    global Image, ImageChops, ImageColor, ImageDraw, ImageFont
+
+    if Image is not None:
+        return
+
+    try:
+        from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont
+
+    except ImportError:
+        raise TileboardError('Tileboard requires the following modules: '
+            'Pillow 3.0.0+ - <https://pypi.python.org/pypi/Pillow>')
 
 
 # All the exceptions Tileboard raises are of this type:
@@ -44,8 +73,259 @@ class TileboardError(Exception):
     pass
 
 
+# Temporary files:
+# (written next to their destination and renamed over it with
+# os.replace(), so that readers never see partial files)
+
+def temporary_suffix():
+    """ Return a unique suffix for a temporary file. """
+    import uuid
+    return '.tileboard-' + uuid.uuid4().hex
+
+
+# Instrumentation:
+# (wall time, CPU time and peak memory per rendering stage, see:
+# --profile, --profile-json and the 'profile_hook' argument for Renderer)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# the active Profiler for the current thread, if any:
+profiling = threading.local()
+
+
+def peak_rss():
+    """ Return the peak resident memory of this process in bytes or None when unknown. """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes everywhere but on Mac OS X:
+    if sys.platform == 'darwin':
+        return peak
+
+    return peak * 1024
+
+
+class Profiler(object):
+    """
+    Collect the time and memory used by each stage of a render
+    (see: profile_stage()), the canvas size and counters
+    such as the number of tiles pasted.
+    """
+    def __init__(self):
+        # name -> stage totals, in the order stages start:
+        self.stages = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.canvas = None
+        self.depth = 0
+
+    def start(self, name):
+        """ Register a stage before it runs. """
+        if not name in self.stages:
+            self.stages[name] = {
+                'stage': name,
+                'depth': self.depth,
+                'calls': 0,
+                'wall': 0.0,
+                'cpu': 0.0,
+                'peak_rss': None,
+                'tracemalloc_peak': None,
+            }
+
+        self.depth += 1
+
+    def finish(self, name, wall, cpu):
+        """ Add the time a stage took. """
+        self.depth -= 1
+
+        stage = self.stages[name]
+        stage['calls'] += 1
+        stage['wall'] += wall
+        stage['cpu'] += cpu
+        stage['peak_rss'] = peak_rss()
+
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            stage['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+
+    def merge(self, other):
+        """
+        Add everything collected by another Profiler (e.g. in a thread,
+        since the active Profiler is per thread) to this one.
+        """
+        for name, stage in other.stages.items():
+            if not name in self.stages:
+                self.stages[name] = dict(stage)
+                continue
+
+            total = self.stages[name]
+            total['calls'] += stage['calls']
+            total['wall'] += stage['wall']
+            total['cpu'] += stage['cpu']
+
+            for key in ('peak_rss', 'tracemalloc_peak'):
+                if stage[key] is not None:
+                    total[key] = max(total[key] or 0, stage[key])
+
+        self.counters.update(other.counters)
+
+        if other.canvas is not None:
+            self.canvas = other.canvas
+
+    def report(self, options):
+        """ Return a dict with everything collected, for 'options'. """
+        canvas = None
+
+        if self.canvas is not None:
+            width, height, mode = self.canvas
+            canvas = { 'width': width, 'height': height, 'mode': mode }
+
+        return {
+            'position': options.position,
+            'filepath': options.filepath,
+            'canvas': canvas,
+            'counters': dict(self.counters),
+            'stages': [dict(stage) for stage in self.stages.values()],
+        }
+
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """ Record the time and memory used by a block in the active Profiler, if any. """
+    profiler = getattr(profiling, 'profiler', None)
+
+    if profiler is None:
+        yield
+        return
+
+    profiler.start(name)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    try:
+        yield
+    finally:
+        profiler.finish(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def profiled(name):
+    """ Decorator, run a function as a profile_stage(). """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def profile_count(name, value):
+    """ Add 'value' to a counter in the active Profiler, if any. """
+    profiler = getattr(profiling, 'profiler', None)
+
+    if profiler is not None:
+        profiler.counters[name] += value
+
+
+def profile_canvas(width, height, mode):
+    """ Record the canvas size in the active Profiler, if any. """
+    profiler = getattr(profiling, 'profiler', None)
+
+    if profiler is not None:
+        profiler.canvas = (width, height, mode)
+
+
+def format_profile(report):
+    """ Return the lines of a human readable profile report. """
+    lines = ['{:<24} {:>6} {:>10} {:>10} {:>14}'.format('stage', 'calls', 'wall (s)', 'cpu (s)', 'peak rss (MB)')]
+
+    for stage in report['stages']:
+        rss = '-' if stage['peak_rss'] is None else '{:.1f}'.format(stage['peak_rss'] / (1024 * 1024))
+
+        lines.append('{:<24} {:>6} {:>10.4f} {:>10.4f} {:>14}'.format(
+            ('  ' * stage['depth']) + stage['stage'], stage['calls'], stage['wall'], stage['cpu'], rss))
+
+    if report['canvas'] is not None:
+        lines.append('canvas: {width}x{height} {mode}'.format(**report['canvas']))
+
+    for name, value in sorted(report['counters'].items()):
+        lines.append('{}: {}'.format(name, value))
+
+    return lines
+
+
+def write_profile_json(report, filepath):
+    """ Append a report to 'filepath' as JSON lines: one per stage and a summary. """
+    lines = []
+
+    for stage in report['stages']:
+        lines.append(dict(stage, position = report['position'], filepath = report['filepath']))
+
+    summary = { name: value for name, value in report.items() if name != 'stages' }
+    summary['stage'] = 'summary'
+    lines.append(summary)
+
+    try:
+        with open(filepath, 'a', encoding = 'utf-8') as descriptor:
+            descriptor.write(''.join(json.dumps(line, sort_keys = True) + '\n' for line in lines))
+
+    except OSError as err:
+        raise TileboardError('Unable to write profile: {}: {}'
+            .format(filepath, err))
+
+
+def run_profiled(options, hook, function, *args):
+    """
+    Call function(*args) and return the result, profiling it when
+    options.profile or options.profile_json are set or there is a hook,
+    which is called with the report (see: Profiler.report()).
+    """
+    if hook is None and not options.profile and options.profile_json is None:
+        return function(*args)
+
+    previous = getattr(profiling, 'profiler', None)
+    profiler = Profiler()
+    profiling.profiler = profiler
+
+    try:
+        with profile_stage('total'):
+            result = function(*args)
+    finally:
+        profiling.profiler = previous
+
+    report = profiler.report(options)
+
+    if options.profile:
+        for line in format_profile(report):
+            print(line, file = sys.stderr, flush = True)
+
+    if options.profile_json is not None:
+        write_profile_json(report, options.profile_json)
+
+    if hook is not None:
+        hook(report)
+
+    return result
+
+
 # Board representation:
 
+# runs of blank squares in braces (e.g. {19}), digits,
+# spaces (also blanks), runs of holes and pieces, in a FEN row:
+POSITION_ROW_REGEX = re.compile('\\{([1-9][0-9]*)\\}|([1-9])|( +)|(0+)|(.)', re.DOTALL)
+
+
 class Board(object):
     """
     Create a Board from a extended FEN position.
@@ -54,19 +334,66 @@ class Board(object):
         - Arbitrary characters, representing pieces in the board.
         - Fordward slashes (row separators).
         - Numbers 1 to 9: as many blank squares as the number value.
+        - Numbers in braces, such as {19}: as many blank squares, any number.
         - Zeros: holes in the board.
+
+    Only the occupied squares and the holes are stored, so huge sparse
+    boards are cheap:
+        - pieces: a list of (piece, row, col), in reading order.
+        - squares: a dict from (row, col) to the piece.
+        - holes: for every row, a list of (start, end) runs of holes.
     """
     def __init__(self, position):
         self.validate_position(position)
 
-        self.rows = self.expand_position_numbers(position).split('/')
-        self.width = max(map(len, self.rows))
-        self.height = len(self.rows)
+        self.pieces = []
+        self.squares = {}
+        self.holes = []
+
+        # pieces in row N are: pieces[row_starts[N]:row_starts[N + 1]]
+        self.row_starts = [0]
+
+        lengths = []
+
+        for row, text in enumerate(position.split('/')):
+            runs = []
+            col = 0
+
+            for match in POSITION_ROW_REGEX.finditer(text):
+                run, digit, spaces, holes, piece = match.groups()
+
+                if piece is not None:
+                    self.pieces.append((piece, row, col))
+                    self.squares[(row, col)] = piece
+                    col += 1
+
+                elif holes is not None:
+                    runs.append((col, col + len(holes)))
+                    col += len(holes)
+
+                elif spaces is not None:
+                    col += len(spaces)
+
+                else:
+                    col += int(run if run is not None else digit)
+
+            self.holes.append(runs)
+            self.row_starts.append(len(self.pieces))
+            lengths.append(col)
+
+        self.width = max(lengths)
+        self.height = len(lengths)
+
+        # fill with holes to make sure that all the rows
+        # have the same length:
+        for runs, length in zip(self.holes, lengths):
+            if length < self.width:
+                if len(runs) > 0 and runs[-1][1] == length:
+                    runs[-1] = (runs[-1][0], self.width)
+                else:
+                    runs.append((length, self.width))
 
-        # fill with zeros (holes) to make sure that all the rows
-        # have the same length, this makes it easier to rotate the board
-        # in case we need it:
-        self.rows = [row.ljust(self.width, '0') for row in self.rows]
+        self.has_holes = any(self.holes)
 
     def validate_position(self, position):
         """
@@ -81,31 +408,129 @@ class Board(object):
         if not has_rows:
             raise TileboardError('Empty FEN position.')
 
-    def expand_position_numbers(self, position):
-        """ Replace numbers from 1..9 with as much spaces as the number value. """
-        return re.sub('[1-9]', lambda match: ' ' * int(match.group(0)), position)
+    def is_hole(self, row, col):
+        """ True when the square at (row, col) is a hole. """
+        return any(start <= col < end for start, end in self.holes[row])
+
+    def square(self, row, col):
+        """ Return the piece at (row, col), ' ' for blanks or '0' for holes. """
+        piece = self.squares.get((row, col))
+
+        if piece is not None:
+            return piece
+
+        return '0' if self.is_hole(row, col) else ' '
+
+    def row_runs(self, row):
+        """ Yields (start, end, is_hole) for the runs of squares and holes in a row. """
+        col = 0
+
+        for start, end in self.holes[row]:
+            if start > col:
+                yield col, start, False
+
+            yield start, end, True
+            col = end
+
+        if col < self.width:
+            yield col, self.width, False
+
+    def row_pieces(self, row):
+        """ Return the (piece, row, col) for the pieces in a row. """
+        return self.pieces[self.row_starts[row]:self.row_starts[row + 1]]
+
+    @property
+    def rows(self):
+        """
+        The board as a list of strings, one character per square
+        (spaces for blanks, zeros for holes). Built on every access,
+        it takes width * height characters.
+        """
+        rows = []
+
+        for row in range(self.height):
+            squares = [' '] * self.width
+
+            for start, end in self.holes[row]:
+                squares[start:end] = ['0'] * (end - start)
+
+            for piece, _, col in self.row_pieces(row):
+                squares[col] = piece
+
+            rows.append(''.join(squares))
+
+        return rows
+
+    def position(self):
+        """
+        Return the board as a FEN position, with long runs of blanks
+        in braces and holes filling every row to the board width.
+        """
+        rows = []
+
+        for row in range(self.height):
+            runs = [(start, end, '0' * (end - start)) for start, end in self.holes[row]]
+            runs.extend((square, square + 1, piece) for piece, _, square in self.row_pieces(row))
+
+            parts = []
+            col = 0
+
+            for start, end, text in sorted(runs):
+                if start > col:
+                    parts.append(blank_run(start - col, parts))
+
+                parts.append(text)
+                col = end
+
+            if col < self.width:
+                parts.append(blank_run(self.width - col, parts))
+
+            rows.append(''.join(parts))
+
+        return '/'.join(rows)
+
+
+def blank_run(count, parts):
+    """
+    Return a FEN run of 'count' blank squares: a digit or a number in braces.
+    Braces are always used after a '{' piece, so that it can't be misread.
+    """
+    if count <= 9 and (len(parts) == 0 or parts[-1] != '{'):
+        return str(count)
+
+    return '{' + str(count) + '}'
 
 
 # Board traversing:
 
 def walk_board(board, ignore_blanks = False, ignore_holes = False):
     """ Yields all the tiles in the board, optionally ignoring holes/blanks. """
-    for row in board.rows:
-        for tile in row:
+    if ignore_blanks and ignore_holes:
+        for piece, row, col in board.pieces:
+            yield piece
+        return
+
+    for tile, row, col in walk_board_rows(board, ignore_blanks, ignore_holes):
+        yield tile
 
-            if tile == ' ' and ignore_blanks:
-                continue
-            if tile == '0' and ignore_holes:
-                continue
 
-            yield tile
+def walk_board_rows(board, ignore_blanks = False, ignore_holes = False, rows = None):
+    """
+    Yields (tile, row, col), for all the tiles in the board
+    or only for those in the given 'rows' (a range).
+    Ignoring both blanks and holes only visits the pieces.
+    """
+    if rows is None:
+        rows = range(board.height)
 
+    if ignore_blanks and ignore_holes:
+        for row in rows:
+            yield from board.row_pieces(row)
+        return
 
-def walk_board_rows(board, ignore_blanks = False, ignore_holes = False):
-    """ Yields (tile, row, col), for all the tiles in the board. """
-    for row in range(board.height):
+    for row in rows:
         for col in range(board.width):
-            tile = board.rows[row][col]
+            tile = board.square(row, col)
 
             if tile == ' ' and ignore_blanks:
                 continue
@@ -160,34 +585,44 @@ def from_base26(string):
 
 # Border text generation:
 
-def generate_border_rows_text(board, uppercase):
+# keyed by the board dimensions, so that every band, size and board
+# with the same dimensions shares them (returned as tuples):
+@functools.lru_cache(maxsize = 16)
+def generate_border_rows_text(width, uppercase):
     """
-    Return a list of words representing border letter coordinates.
-    (e.g. ['a', 'b', 'c', 'd' ..., 'z', 'aa', 'ab', ...])
+    Return a tuple of words representing border letter coordinates
+    for a board 'width' squares wide.
+    (e.g. ('a', 'b', 'c', 'd' ..., 'z', 'aa', 'ab', ...))
     """
     if uppercase:
-        return [to_base26(number).upper() for number in range(board.width)]
+        return tuple(to_base26(number).upper() for number in range(width))
     else:
-        return [to_base26(number).lower() for number in range(board.width)]
+        return tuple(to_base26(number).lower() for number in range(width))
 
 
-def generate_border_cols_text(board):
+@functools.lru_cache(maxsize = 16)
+def generate_border_cols_text(height):
     """
-    Return a list of words representing border number coordinates.
-    (e.g. ['11', '10', ... '4', '3', '2', '1'])
+    Return a tuple of words representing border number coordinates
+    for a board 'height' squares tall.
+    (e.g. ('11', '10', ... '4', '3', '2', '1'))
     in reverse order.
     """
-    return [str(number) for number in range(board.height, 0, -1)]
+    return tuple(str(number) for number in range(height, 0, -1))
 
 
 # Algebraic position parsing:
 
+# compiled once, there can be a position for every board square:
+POSITION_REGEX = re.compile('^([A-Z]+)([0-9]+)$', re.IGNORECASE)
+
+
 def parse_position(position, board):
     """
     Read an algebraic position string such as: 'A1' or: 'a1'
     and return (X, Y) coordinates from top to bottom on board.
     """
-    match = re.search('^([A-Z]+)([0-9]+)$', position, re.IGNORECASE)
+    match = POSITION_REGEX.search(position)
 
     if not match or match.lastindex != 2:
         raise TileboardError('Invalid position: {}'.format(position))
@@ -208,6 +643,70 @@ def parse_positions(positions, board):
     return [parse_position(position, board) for position in positions]
 
 
+def split_positions(positions):
+    """
+    Split a list of positions where each item can contain many positions
+    separated by commas or whitespace, e.g: ['a1,b2', 'c3'] -> ['a1', 'b2', 'c3'].
+    """
+    return [position for item in positions for position in re.split(r'[\s,]+', item) if position != '']
+
+
+def read_positions_file(filepath):
+    """ Read a file with positions separated by commas, whitespace or newlines. """
+    try:
+        with open(filepath, 'r', encoding = 'utf-8') as descriptor:
+            return split_positions([descriptor.read()])
+
+    except (OSError, UnicodeDecodeError) as err:
+        raise TileboardError('Unable to read positions: {}: {}'
+            .format(filepath, err))
+
+
+def parse_bitboard(bitboard, board):
+    """
+    Read a bitboard: an integer (e.g. '0xff00' or '65280') where each bit
+    is a square, starting from the bottom left, left to right and then upwards.
+    For chess: a1 = bit 0, h1 = bit 7, a8 = bit 56, h8 = bit 63.
+    Returns a list of (X, Y) coordinates from top to bottom on board.
+    """
+    try:
+        value = int(bitboard, 0)
+    except ValueError:
+        raise TileboardError('Invalid bitboard: {}'.format(bitboard))
+
+    if value < 0:
+        raise TileboardError('Invalid bitboard: {}'.format(bitboard))
+
+    if value.bit_length() > board.width * board.height:
+        raise TileboardError('Bitboard out of board: {}'.format(bitboard))
+
+    # scan the binary digits once, from the lowest bit:
+    bits = bin(value)[:1:-1]
+
+    return [(index % board.width, board.height - 1 - (index // board.width))
+        for index in (match.start() for match in re.finditer('1', bits))]
+
+
+def parse_marks(board, positions, filepath = None, bitboard = None):
+    """
+    Return the set of (X, Y) coordinates marked by a list of positions
+    (see: split_positions()), a positions file and a bitboard.
+    Duplicated squares are collapsed.
+    """
+    positions = split_positions(positions)
+
+    if filepath is not None:
+        positions += read_positions_file(filepath)
+
+    # parse each distinct position once:
+    coords = set(parse_positions(dict.fromkeys(positions), board))
+
+    if bitboard is not None:
+        coords.update(parse_bitboard(bitboard, board))
+
+    return coords
+
+
 # Loading tilesets:
 
 def piece_to_filename(piece):
@@ -233,6 +732,16 @@ def piece_to_filename(piece):
     return filename
 
 
+def file_signature(filepath):
+    """ Return (modification time, size) for a file or None when it can't be read. """
+    try:
+        stat = os.stat(filepath)
+        return stat.st_mtime_ns, stat.st_size
+
+    except OSError:
+        return None
+
+
 def validate_tile_sizes(images):
     """ Ensure that a set of images are squares of equal size. """
     last_image_size = None
@@ -258,607 +767,4298 @@ def validate_tile_sizes(images):
     return last_image_size
 
 
-def load_tileset(board, folder):
-    """ Load all the piece images required to draw a board. """
-    images = {}
+def load_tile(folder, piece):
+    """ Load the image for a single piece from a tileset folder. """
+    import_pillow()
 
-    for piece in walk_board(board, ignore_blanks = True, ignore_holes = True):
-        if not piece in images:
-            filename = piece_to_filename(piece)
-            filepath = os.path.join(folder, filename)
+    filename = piece_to_filename(piece)
+    filepath = os.path.join(folder, filename)
 
-            try:
-                image = Image.open(filepath)
-                image.load()
-                images[piece] = image
+    try:
+        image = Image.open(filepath)
+        image.load()
+        return image
 
-            except Exception as err:
-               raise TileboardError('Unable to load image: {} for: {}: {}'
-                   .format(filepath, piece, err))
+    except Exception as err:
+       raise TileboardError('Unable to load image: {} for: {}: {}'
+           .format(filepath, piece, err))
 
-    return images
 
+def prepare_tile(image):
+    """
+    Normalize a tile to the canvas mode (RGBA) and split its
+    transparency mask, so that pasting it needs no conversions.
+    Returns (image, mask).
+    """
+    if image.mode != 'RGBA':
+        filename = image.filename
+        image = image.convert('RGBA')
 
-# Generating tiles for crosses and dots:
-# (Pillow does not support antialiasing in ImageDraw)
+        # keep it for error messages in validate_tile_sizes():
+        image.filename = filename
 
-def generate_tile(tilesize, drawing_function, color, factor = 4):
+    return image, image.split()[3]
+
+
+class Tileset(object):
     """
-    Create a tile of 'factor' times the requested 'tilesize'
-    draw on it using 'drawing_function' and return an antialiased resized copy.
+    The piece tiles needed to draw a board, prepared by prepare_tile()
+    and their common size (None when there are no pieces).
     """
-    size = tilesize * factor
-    tile = Image.new('RGBA', (size, size))
+    def __init__(self, tiles, tilesize):
+        self.tiles = tiles
+        self.tilesize = tilesize
 
-    draw = ImageDraw.Draw(tile)
-    drawing_function(draw, size, color)
-    del draw
+    def __getitem__(self, piece):
+        """ Return (image, mask) for a piece. """
+        return self.tiles[piece]
 
-    return tile.resize((tilesize, tilesize), Image.ANTIALIAS)
+    def __len__(self):
+        return len(self.tiles)
 
 
-def draw_cross_tile(draw, size, color):
-    """ Draw an X tile for cross marks. """
-    offset = size // 3
-    length = size - offset
-    width  = size // 10
+def load_tileset(board, folder):
+    """ Load and prepare all the piece images required to draw a board. """
+    tiles = {}
 
-    draw.line((offset, offset, length, length), fill = color, width = width)
-    draw.line((length, offset, offset, length), fill = color, width = width)
+    for piece in walk_board(board, ignore_blanks = True, ignore_holes = True):
+        if not piece in tiles:
+            tiles[piece] = prepare_tile(load_tile(folder, piece))
 
+    tilesize = validate_tile_sizes(image for image, mask in tiles.values())
+    return Tileset(tiles, tilesize)
 
-def draw_dot_tile(draw, size, color):
-    """ Create a ellipse tile for dot marks. """
-    center = size // 2
-    radius = size // 6
 
-    # same coordinates for X and Y since it's a square:
-    start = center - radius
-    end = center + radius
+# Tileset roots:
+# (folders with a subfolder for each size, e.g: Tiles/alpha/20 ... Tiles/alpha/300)
 
-    draw.ellipse((start, start, end, end), fill = color)
+def tileset_sizes(folder):
+    """ Return the sorted sizes of the subfolders named after sizes in a folder. """
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
 
+    return sorted(int(name) for name in names
+        if name.isdigit() and os.path.isdir(os.path.join(folder, name)))
 
-# Loading fonts:
 
-def load_font(filepath, size):
-    """
-    Load a TrueType font.
-    """
-    try:
-        return ImageFont.truetype(filepath, size)
+def is_tileset_root(folder):
+    """ True when a folder contains subfolders named after sizes. """
+    return len(tileset_sizes(folder)) > 0
 
-    except Exception as err:
-        raise TileboardError('Unable to load font: {}: {}'
-            .format(filepath, err))
 
+def closest_tileset_size(sizes, size):
+    """
+    Return the smallest size that is at least 'size' (downsampling
+    looks better than upsampling) or the biggest when none are.
+    """
+    for available in sizes:
+        if available >= size:
+            return available
 
-# Calculating sizes:
+    return sizes[-1]
 
-def calculate_outline_size(tilesize):
-    """ Calculate ideal outline size. """
-    # so that big tilesizes get a bigger outline:
-    # (e.g. tilesize 300 means 3px outlines)
-    return max(tilesize // 100, 1)
 
+def default_resample_folder():
+    """
+    Where to keep resampled tiles when no folder is given: a per-user
+    cache folder (e.g. ~/.cache/Tileboard/tiles), created private.
+    Returns None when the folder can't be used safely (e.g. it belongs
+    to another user, who could plant tiles in it).
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
 
-def calculate_border_font_size(tilesize):
-    """ Calculate ideal border font size. """
-    # this could be more clever, right now we just have a minimum
-    # readable size (12px) and scale to the tile size:
-    return max(tilesize // 3, 12)
+    folder = os.path.join(base, 'Tileboard', 'tiles')
 
+    try:
+        os.makedirs(folder, mode = 0o700, exist_ok = True)
+        stat = os.stat(folder)
 
-def calculate_border_size(board, tilesize, font):
-    """ Calculate the minimum border size needed to draw the border text. """
-    border_size = tilesize // 2
+    except OSError:
+        return None
 
-    max_col_text = to_base26(board.width)
-    max_row_text = str(board.height)
+    # only our own folder, not writable by anyone else:
+    if hasattr(os, 'getuid') and (stat.st_uid != os.getuid() or stat.st_mode & 0o022):
+        return None
 
-    max_col_text_width, _ = font.getsize(max_col_text)
-    max_row_text_width, _ = font.getsize(max_row_text)
+    return folder
 
-    # include 10px padding:
-    max_col_text_width += 10
-    max_row_text_width += 10
 
-    return max(border_size, max_col_text_width, max_row_text_width)
+def resample_tile(folder, piece, size):
+    """ Load a piece from a tileset folder and resample it to 'size'. """
+    image = load_tile(folder, piece).convert('RGBA').resize((size, size), Image.LANCZOS)
+    image.filename = os.path.join(folder, piece_to_filename(piece))
 
+    return image
 
-# Generic drawing helpers:
-# (no board specific information)
 
-def draw_rectangle_outline(image, x1, y1, x2, y2, width, color):
+def load_resampled_tile(folder, piece, size, resample_folder = None):
     """
-    Draw a rectangle outline.
+    Load a piece from a tileset folder, resampled to 'size'.
+    Resampled tiles are kept in 'resample_folder', named after
+    a hash of the source tile and the size, so each one is only
+    resampled once. When no folder is given, the default one is used
+    (see: default_resample_folder()) or none when it isn't safe.
     """
-    draw = ImageDraw.Draw(image)
+    import_pillow()
 
-    # top left -> bottom left
-    rect = [x1, y1, x1 + width, y2]
-    draw.rectangle(rect, fill = color)
+    if resample_folder is None:
+        resample_folder = default_resample_folder()
 
-    # top left -> top right
-    rect = [x1, y1, x2, y1 + width]
-    draw.rectangle(rect, fill = color)
+        if resample_folder is None:
+            return resample_tile(folder, piece, size)
 
-    # top right -> bottom right
+    filepath = os.path.join(folder, piece_to_filename(piece))
+
+    try:
+        with open(filepath, 'rb') as source:
+            digest = hashlib.sha256(source.read()).hexdigest()
+
+    except OSError as err:
+        raise TileboardError('Unable to load image: {} for: {}: {}'
+            .format(filepath, piece, err))
+
+    cached = os.path.join(resample_folder, '{}-{}.png'.format(digest, size))
+
+    if os.path.isfile(cached):
+        try:
+            image = Image.open(cached)
+            image.load()
+            return image
+
+        # unreadable, resample again:
+        except Exception:
+            pass
+
+    image = resample_tile(folder, piece, size)
+
+    # the cache is an optimization, failing to write to it is fine:
+    try:
+        os.makedirs(resample_folder, exist_ok = True)
+
+        temporary = os.path.join(resample_folder, temporary_suffix())
+        image.save(temporary, 'PNG')
+        os.replace(temporary, cached)
+
+    except OSError:
+        pass
+
+    return image
+
+
+# Tileset bundles:
+# (a single file with the decoded pixels and masks of every tile
+# in every size, memory-mapped instead of decoding PNG files)
+#
+# Layout:
+#     header: magic, version, index length (see: BUNDLE_HEADER)
+#     index: JSON list of [filename, size, offset]
+#     data: for each tile, RGBA pixels (size * size * 4 bytes)
+#           followed by the mask (size * size bytes)
+
+BUNDLE_MAGIC = b'TILEBOARD-BUNDLE'
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct('<16sII')
+
+
+def is_tileset_bundle(folder):
+    """ True when a tileset folder is a bundle file instead. """
+    return os.path.isfile(folder)
+
+
+def pack_tileset(folder, filepath):
+    """
+    Write the tiles in a tileset folder (or tileset root) to a bundle.
+    Returns (number of sizes, number of tiles).
+    """
+    import_pillow()
+
+    sizes = tileset_sizes(folder)
+
+    if len(sizes) > 0:
+        folders = [os.path.join(folder, str(size)) for size in sizes]
+    else:
+        folders = [folder]
+
+    index = []
+    chunks = []
+    offset = 0
+
+    for source in folders:
+        try:
+            filenames = sorted(name for name in os.listdir(source)
+                if os.path.isfile(os.path.join(source, name)))
+
+        except OSError as err:
+            raise TileboardError('Unable to read tileset folder: {}: {}'
+                .format(source, err))
+
+        images = []
+
+        for filename in filenames:
+            tile_filepath = os.path.join(source, filename)
+
+            try:
+                image = Image.open(tile_filepath)
+                image.load()
+
+            except Exception as err:
+                raise TileboardError('Unable to load image: {}: {}'
+                    .format(tile_filepath, err))
+
+            images.append((filename, image))
+
+        size = validate_tile_sizes(image for filename, image in images)
+
+        for filename, image in images:
+            image, mask = prepare_tile(image)
+            data = image.tobytes() + mask.tobytes()
+
+            index.append([filename, size, offset])
+            chunks.append(data)
+            offset += len(data)
+
+    header = json.dumps(index).encode('utf-8')
+    temporary = filepath + temporary_suffix()
+
+    try:
+        with open(temporary, 'wb') as descriptor:
+            descriptor.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(header)))
+            descriptor.write(header)
+
+            for data in chunks:
+                descriptor.write(data)
+
+        os.replace(temporary, filepath)
+
+    except OSError as err:
+        raise TileboardError('Unable to write bundle: {}: {}'
+            .format(filepath, err))
+
+    return len(folders), len(index)
+
+
+class TilesetBundle(object):
+    """
+    A memory-mapped tileset bundle, see: pack_tileset().
+    Tiles are built directly on the mapped pixels, the only
+    thing read when opening a bundle is the index.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        try:
+            with open(filepath, 'rb') as descriptor:
+                self.buffer = mmap.mmap(descriptor.fileno(), 0, access = mmap.ACCESS_READ)
+
+            magic, version, length = BUNDLE_HEADER.unpack_from(self.buffer, 0)
+
+            if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+                raise ValueError('not a version {} bundle'.format(BUNDLE_VERSION))
+
+            start = BUNDLE_HEADER.size
+            index = json.loads(self.buffer[start:start + length].decode('utf-8'))
+
+        except (OSError, ValueError, struct.error) as err:
+            raise TileboardError('Unable to load tileset bundle: {}: {}'
+                .format(filepath, err))
+
+        # where the tile data starts:
+        base = start + length
+
+        # (filename, size) -> offset:
+        self.offsets = { (filename, size): base + offset for filename, size, offset in index }
+        self.sizes = sorted(set(size for filename, size, offset in index))
+
+    def tile(self, piece, size):
+        """
+        Return (image, mask) for a piece, resampled from the closest
+        size available when the bundle doesn't have 'size'.
+        """
+        if len(self.sizes) == 0:
+            raise TileboardError('Empty tileset bundle: {}'.format(self.filepath))
+
+        source_size = closest_tileset_size(self.sizes, size)
+        offset = self.offsets.get((piece_to_filename(piece), source_size))
+
+        if offset is None:
+            raise TileboardError('Unable to load image: {}:{}/{} for: {}'
+                .format(self.filepath, source_size, piece_to_filename(piece), piece))
+
+        pixels = source_size * source_size
+        view = memoryview(self.buffer)
+
+        image = Image.frombuffer('RGBA', (source_size, source_size), view[offset:offset + pixels * 4], 'raw', 'RGBA', 0, 1)
+        mask = Image.frombuffer('L', (source_size, source_size), view[offset + pixels * 4:offset + pixels * 5], 'raw', 'L', 0, 1)
+
+        if source_size != size:
+            image = image.resize((size, size), Image.LANCZOS)
+            mask = image.getchannel('A')
+
+        return image, mask
+
+
+# Tile cache:
+
+class TileCache(object):
+    """
+    A process-wide cache of loaded tiles, keyed by (folder, piece).
+
+    Tiles are stored prepared (see: prepare_tile()) and revalidated
+    against the file modification time and size on every lookup,
+    so edited files are picked up. When the tiles take more than 'budget'
+    bytes, the least recently used ones are evicted.
+    """
+    def __init__(self, budget = 64 * 1024 * 1024):
+        self.budget = budget
+        self.used = 0
+
+        # (folder, piece) -> (signature, (image, mask), bytes), in LRU order:
+        self.tiles = collections.OrderedDict()
+
+        # validate_tile_sizes() results, per tileset signature:
+        self.tilesizes = {}
+
+        # tileset_sizes() results, per tileset root:
+        self.roots = {}
+
+        # bundle filepath -> (signature, TilesetBundle):
+        self.bundles = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def tile(self, folder, piece, size = None, resample_folder = None):
+        """
+        Return (signature, (image, mask)) for a piece, loading it when needed.
+        When 'size' is given, 'folder' is a tileset root or bundle and the
+        tile is resampled from the closest size available
+        (see: load_resampled_tile() and TilesetBundle.tile()).
+        """
+        if size is None:
+            key = (folder, piece)
+            signature = file_signature(os.path.join(folder, piece_to_filename(piece)))
+            loader = lambda: prepare_tile(load_tile(folder, piece))
+
+        elif is_tileset_bundle(folder):
+            key = (folder, piece, size)
+            signature = file_signature(folder)
+            loader = lambda: self.bundle(folder, signature).tile(piece, size)
+
+        else:
+            key = (folder, piece, size)
+            source_size = closest_tileset_size(self.root_sizes(folder), size)
+            source_folder = os.path.join(folder, str(source_size))
+            signature = file_signature(os.path.join(source_folder, piece_to_filename(piece)))
+
+            if source_size == size:
+                loader = lambda: prepare_tile(load_tile(source_folder, piece))
+            else:
+                loader = lambda: prepare_tile(load_resampled_tile(source_folder, piece, size, resample_folder))
+
+        entry = self.tiles.get(key)
+        if entry is not None:
+            if signature is not None and entry[0] == signature:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return signature, entry[1]
+
+            # stale:
+            self.remove(key)
+
+        self.misses += 1
+        tile = loader()
+
+        # RGBA image + L mask:
+        image, _ = tile
+        size = image.width * image.height * 5
+
+        self.tiles[key] = (signature, tile, size)
+        self.used += size
+        self.evict()
+
+        return signature, tile
+
+    def tileset(self, board, folder, size = None, resample_folder = None):
+        """
+        Like load_tileset(), but using the cache.
+        The tile size validation is memoized per tileset.
+        When 'size' is given, 'folder' is a tileset root, see: tile().
+        """
+        tiles = {}
+        signatures = []
+
+        for piece in walk_board(board, ignore_blanks = True, ignore_holes = True):
+            if not piece in tiles:
+                signature, tiles[piece] = self.tile(folder, piece, size, resample_folder)
+                signatures.append((piece, signature))
+
+        key = (folder, size, tuple(sorted(signatures)))
+
+        # bundle tiles were validated when packed:
+        if size is not None and is_tileset_bundle(folder):
+            return Tileset(tiles, size if len(tiles) > 0 else None)
+
+        if not key in self.tilesizes:
+            # unbounded growth is not a concern for the usual
+            # handful of tilesets, but don't let it run away:
+            if len(self.tilesizes) >= 4096:
+                self.tilesizes.clear()
+
+            self.tilesizes[key] = validate_tile_sizes(image for image, mask in tiles.values())
+
+        return Tileset(tiles, self.tilesizes[key])
+
+    def root_sizes(self, folder):
+        """ Like tileset_sizes(), memoized until the folder changes. """
+        signature = file_signature(folder)
+        entry = self.roots.get(folder)
+
+        if entry is None or entry[0] != signature:
+            entry = (signature, tileset_sizes(folder))
+            self.roots[folder] = entry
+
+        return entry[1]
+
+    def bundle(self, filepath, signature):
+        """ Return the TilesetBundle for a file, opened again when it changes. """
+        entry = self.bundles.get(filepath)
+
+        if entry is None or entry[0] != signature:
+            entry = (signature, TilesetBundle(filepath))
+            self.bundles[filepath] = entry
+
+        return entry[1]
+
+    def remove(self, key):
+        """ Remove a tile from the cache. """
+        _, _, size = self.tiles.pop(key)
+        self.used -= size
+
+    def evict(self):
+        """ Remove least recently used tiles until we are within budget. """
+        while self.used > self.budget and len(self.tiles) > 0:
+            self.remove(next(iter(self.tiles)))
+            self.evictions += 1
+
+    def clear(self):
+        """ Remove all the tiles and memoized sizes. """
+        self.tiles.clear()
+        self.tilesizes.clear()
+        self.bundles.clear()
+        self.used = 0
+
+    def stats(self):
+        """ Return a dict with the cache counters, useful to size the budget. """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'tiles': len(self.tiles),
+            'used': self.used,
+            'budget': self.budget,
+        }
+
+
+# shared by all the renderers in the process:
+tile_cache = TileCache()
+
+
+# Generating tiles for crosses and dots:
+# (Pillow does not support antialiasing in ImageDraw)
+
+def generate_tile(tilesize, drawing_function, color, factor = 4):
+    """
+    Create a tile of 'factor' times the requested 'tilesize'
+    draw on it using 'drawing_function' and return an antialiased resized copy.
+    """
+    import_pillow()
+
+    size = tilesize * factor
+    tile = Image.new('RGBA', (size, size))
+
+    draw = ImageDraw.Draw(tile)
+    drawing_function(draw, size, color)
+    del draw
+
+    return tile.resize((tilesize, tilesize), Image.ANTIALIAS)
+
+
+def draw_cross_tile(draw, size, color):
+    """ Draw an X tile for cross marks. """
+    offset = size // 3
+    length = size - offset
+    width  = size // 10
+
+    draw.line((offset, offset, length, length), fill = color, width = width)
+    draw.line((length, offset, offset, length), fill = color, width = width)
+
+
+def draw_dot_tile(draw, size, color):
+    """ Create a ellipse tile for dot marks. """
+    center = size // 2
+    radius = size // 6
+
+    # same coordinates for X and Y since it's a square:
+    start = center - radius
+    end = center + radius
+
+    draw.ellipse((start, start, end, end), fill = color)
+
+
+# Loading fonts:
+
+@profiled('load_font')
+def load_font(filepath, size):
+    """
+    Load a TrueType font.
+    """
+    import_pillow()
+
+    try:
+        return ImageFont.truetype(filepath, size)
+
+    except Exception as err:
+        raise TileboardError('Unable to load font: {}: {}'
+            .format(filepath, err))
+
+
+# Resource cache:
+
+# options that change the board background (see: draw_background()):
+BACKGROUND_OPTIONS = (
+    'outer_outline_color', 'outer_outline_disable',
+    'border_color', 'border_disable', 'border_uppercase', 'border_font', 'border_font_color',
+    'inner_outline_color', 'inner_outline_disable',
+    'checkerboard_color0', 'checkerboard_color1', 'checkerboard_color2',
+    'checkerboard_disable', 'checkerboard_holes_disable',
+)
+
+
+class MemoryCache(object):
+    """
+    An LRU cache that keeps up to 'budget' units, as measured by
+    'sizeof' for each value (e.g. bytes, or 1 to count entries).
+    Values bigger than the whole budget are not kept.
+    Safe to share between threads.
+    """
+    def __init__(self, budget, sizeof):
+        self.budget = budget
+        self.sizeof = sizeof
+        self.used = 0
+        self.lock = threading.Lock()
+
+        # key -> (value, size), in LRU order:
+        self.values = collections.OrderedDict()
+
+    def get(self, key):
+        """ Return the value for a key or None. """
+        with self.lock:
+            entry = self.values.get(key)
+
+            if entry is None:
+                return None
+
+            self.values.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """ Add a value, evicting the least recently used ones as needed. """
+        size = self.sizeof(value)
+
+        with self.lock:
+            if key in self.values or size > self.budget:
+                return
+
+            self.values[key] = (value, size)
+            self.used += size
+
+            while self.used > self.budget:
+                _, (_, old_size) = self.values.popitem(last = False)
+                self.used -= old_size
+
+
+def label_size(label):
+    """ Approximate bytes used by a render_label() result. """
+    width, mask, dx, dy = label
+    return 64 + (0 if mask is None else mask.width * mask.height)
+
+
+class ResourceCache(object):
+    """
+    Keep loaded tiles, fonts, labels and mark tiles around between renders,
+    so that drawing many boards in the same process only loads them once.
+    Fonts, labels and mark tiles are LRU caches with a fixed budget,
+    so that long running processes (e.g. the server) don't grow forever.
+
+    Board backgrounds are also kept, up to 'background_budget' bytes,
+    so that boards with the same shape and style only draw the pieces.
+    """
+    def __init__(self, tiles = None, background_budget = 32 * 1024 * 1024):
+        self.tiles = tiles if tiles is not None else tile_cache
+
+        # up to 64 fonts, 8 MB of labels and 16 MB of mark tiles:
+        self.fonts = MemoryCache(64, lambda font: 1)
+        self.font_labels = MemoryCache(8 * 1024 * 1024, label_size)
+        self.mark_tiles = MemoryCache(16 * 1024 * 1024, lambda tile: tile.width * tile.height * 4)
+
+        # key -> image, in LRU order:
+        self.backgrounds = collections.OrderedDict()
+        self.backgrounds_used = 0
+        self.background_budget = background_budget
+
+    def tileset(self, board, folder, size = None, resample_folder = None):
+        """ Return the Tileset for a board, see: TileCache.tileset(). """
+        return self.tiles.tileset(board, folder, size, resample_folder)
+
+    def font(self, filepath, size):
+        """ Like load_font(), but reusing previously loaded fonts. """
+        key = (filepath, size)
+        font = self.fonts.get(key)
+
+        if font is None:
+            font = load_font(filepath, size)
+            self.fonts.put(key, font)
+
+        return font
+
+    def labels(self):
+        """
+        Return the cache of rendered labels (see: get_label()).
+        Labels are masks, so they are shared between font colors.
+        """
+        return self.font_labels
+
+    def mark_tile(self, tilesize, drawing_function, color):
+        """ Like generate_tile(), but reusing previously generated tiles. """
+        key = (tilesize, drawing_function, color)
+        tile = self.mark_tiles.get(key)
+
+        if tile is None:
+            tile = generate_tile(tilesize, drawing_function, color, factor = 4)
+            self.mark_tiles.put(key, tile)
+
+        return tile
+
+    @profiled('background')
+    def background(self, board, layout, options):
+        """
+        Return an image with the background for a board, as drawn by
+        draw_background(). The image is shared, copy it before drawing on it.
+        """
+        # only the holes matter, not the pieces:
+        holes = tuple(tuple(runs) for runs in board.holes)
+        settings = tuple(getattr(options, name) for name in BACKGROUND_OPTIONS)
+
+        key = (board.width, holes, layout.tilesize, settings)
+        image = self.backgrounds.get(key)
+
+        if image is not None:
+            self.backgrounds.move_to_end(key)
+            return image
+
+        image = Image.new('RGBA', (layout.width, layout.height))
+        draw_background(image, 0, 0, board, layout, options)
+
+        size = layout.width * layout.height * 4
+
+        if size <= self.background_budget:
+            self.backgrounds[key] = image
+            self.backgrounds_used += size
+
+            while self.backgrounds_used > self.background_budget:
+                _, old = self.backgrounds.popitem(last = False)
+                self.backgrounds_used -= old.width * old.height * 4
+
+        return image
+
+    def fits_background(self, layout):
+        """ True when the background for a layout is small enough to be kept. """
+        return layout.width * layout.height * 4 <= self.background_budget
+
+
+# Calculating sizes:
+
+def calculate_outline_size(tilesize):
+    """ Calculate ideal outline size. """
+    # so that big tilesizes get a bigger outline:
+    # (e.g. tilesize 300 means 3px outlines)
+    return max(tilesize // 100, 1)
+
+
+def calculate_border_font_size(tilesize):
+    """ Calculate ideal border font size. """
+    # this could be more clever, right now we just have a minimum
+    # readable size (12px) and scale to the tile size:
+    return max(tilesize // 3, 12)
+
+
+@profiled('border_size')
+def calculate_border_size(board, tilesize, font):
+    """ Calculate the minimum border size needed to draw the border text. """
+    border_size = tilesize // 2
+
+    max_col_text = to_base26(board.width)
+    max_row_text = str(board.height)
+
+    max_col_text_width, _ = font.getsize(max_col_text)
+    max_row_text_width, _ = font.getsize(max_row_text)
+
+    # include 10px padding:
+    max_col_text_width += 10
+    max_row_text_width += 10
+
+    return max(border_size, max_col_text_width, max_row_text_width)
+
+
+# Generic drawing helpers:
+# (no board specific information)
+
+def is_visible_span(image, y, height):
+    """ True when the vertical span from 'y' to 'y + height' intersects the image. """
+    return (y < image.height) and (y + height > 0)
+
+
+@profiled('outlines')
+def draw_rectangle_outline(image, x1, y1, x2, y2, width, color):
+    """
+    Draw a rectangle outline.
+    """
+    draw = ImageDraw.Draw(image)
+
+    # top left -> bottom left
+    rect = [x1, y1, x1 + width, y2]
+    draw.rectangle(rect, fill = color)
+
+    # top left -> top right
+    rect = [x1, y1, x2, y1 + width]
+    draw.rectangle(rect, fill = color)
+
+    # top right -> bottom right
     rect = [x2, y1, x2 - width, y2]
     draw.rectangle(rect, fill = color)
 
-    # bottom left -> bottom right
-    rect = [x1, y2, x2, y2 - width]
-    draw.rectangle(rect, fill = color)
+    # bottom left -> bottom right
+    rect = [x1, y2, x2, y2 - width]
+    draw.rectangle(rect, fill = color)
+
+    del draw
+
+
+def render_label(word, font):
+    """
+    Render a word as an 'L' mask cropped to the pixels it covers.
+    Returns (width, mask, dx, dy) where 'width' is the font width of the word
+    and (dx, dy) the mask position relative to where draw.text() would place it.
+    The mask is None for words that don't draw anything.
+    """
+    width, height = font.getsize(word)
+    padding = max(width, height)
+
+    mask = Image.new('L', (width + (padding * 2), height + (padding * 2)), 0)
+
+    draw = ImageDraw.Draw(mask)
+    draw.text((padding, padding), word, font = font, fill = 255)
+    del draw
+
+    box = mask.getbbox()
+
+    if box is None:
+        return width, None, 0, 0
+
+    return width, mask.crop(box), box[0] - padding, box[1] - padding
+
+
+def get_label(labels, word, font):
+    """ Like render_label(), but using (and filling) a MemoryCache of labels. """
+    if labels is None:
+        return render_label(word, font)
+
+    key = (font, word)
+    label = labels.get(key)
+
+    if label is None:
+        label = render_label(word, font)
+        labels.put(key, label)
+
+    return label
+
+
+def measure_words(words, font, labels = None):
+    """
+    Return the (left, top, right, bottom) box that all the words cover,
+    relative to the position used when drawing each one: horizontally
+    centered and with the top at 'y'. None when nothing would be drawn.
+    """
+    box = None
+
+    for word in words:
+        width, mask, dx, dy = get_label(labels, word, font)
+
+        if mask is None:
+            continue
+
+        left = dx - (width // 2)
+        word_box = (left, dy, left + mask.width, dy + mask.height)
+
+        if box is None:
+            box = word_box
+        else:
+            box = (min(box[0], word_box[0]), min(box[1], word_box[1]),
+                   max(box[2], word_box[2]), max(box[3], word_box[3]))
+
+    return box
+
+
+def draw_label(image, x, y, label, font_color):
+    """
+    Draw a label from render_label(), horizontally centered at 'x'.
+    Pastes the color through the mask, which gives the same result as draw.text().
+    """
+    width, mask, dx, dy = label
+
+    if mask is not None:
+        image.paste(font_color, (x - (width // 2) + dx, y + dy), mask)
+
+
+@profiled('border_text')
+def draw_horizontal_words(image, x, y, words, spacing, font, font_size, font_color, labels = None):
+    """
+    Draw a series of words horizontally with a constant spacing.
+    When given, 'labels' is a dict used to render each word only once.
+    """
+    # nothing to do when drawing a region that doesn't include them:
+    if not is_visible_span(image, y, font_size * 2):
+        return
+
+    # draw:
+    for index, word in enumerate(words):
+        draw_label(image, x + (spacing * index), y, get_label(labels, word, font), font_color)
+
+
+@profiled('border_text')
+def draw_vertical_words(image, x, y, words, spacing, font, font_size, font_color, labels = None):
+    """
+    Draw a series of words vertically with a constant spacing.
+    When given, 'labels' is a dict used to render each word only once.
+    """
+    # draw:
+    for index, word in enumerate(words):
+        y1 = y + (spacing * index) - (font_size // 2)
+
+        if not is_visible_span(image, y1, font_size * 2):
+            continue
+
+        draw_label(image, x, y1, get_label(labels, word, font), font_color)
+
+
+def draw_mirrored(image, box1, box2, draw):
+    """
+    Call draw() to draw inside 'box1' and paste the result in 'box2'
+    instead of drawing it again, as long as both boxes are inside the image,
+    don't overlap and have identical contents before drawing.
+    Returns False (without drawing) otherwise.
+    """
+    for left, top, right, bottom in (box1, box2):
+        if left < 0 or top < 0 or right > image.width or bottom > image.height:
+            return False
+
+    overlap_x = box1[0] < box2[2] and box2[0] < box1[2]
+    overlap_y = box1[1] < box2[3] and box2[1] < box1[3]
+
+    if overlap_x and overlap_y:
+        return False
+
+    if image.crop(box1).tobytes() != image.crop(box2).tobytes():
+        return False
+
+    draw()
+    image.paste(image.crop(box1), box2[:2])
+    return True
+
+
+# Specific drawing helpers for the board itself:
+# (have board specific information)
+
+def visible_rows(image, y, board, tilesize):
+    """
+    Return the range of board rows that are (at least partially) inside
+    the image, when the board squares start at 'y'.
+    """
+    first = max(0, -y // tilesize)
+    last = min(board.height, (image.height - y + tilesize - 1) // tilesize)
+
+    return range(first, max(first, last))
+
+
+def make_checkerboard_rows(width, tilesize, height, color1, color2):
+    """
+    Create two images, 'width' squares wide and 'height' pixels tall,
+    with the checkerboard pattern for even and odd rows.
+    """
+    rows = []
+
+    for parity in (0, 1):
+        row = Image.new('RGBA', (width * tilesize, height), color2)
+
+        for col in range(parity, width, 2):
+            x1 = col * tilesize
+            row.paste(color1, (x1, 0, x1 + tilesize, height))
+
+        rows.append(row)
+
+    return rows
+
+
+@profiled('checkerboard')
+def draw_checkerboard(image, x, y, board, tilesize, color0, color1, color2):
+    """
+    Draw the checkerboard pattern and the holes (unless color0 is None).
+
+    Instead of drawing every square, each row is split in runs of holes
+    and runs of squares. Holes are filled and squares are pasted
+    from prebuilt rows with the pattern, one run at a time.
+    """
+    # no need for the pattern to be taller than the image:
+    pattern_height = min(tilesize, image.height)
+    pattern_rows = make_checkerboard_rows(board.width, tilesize, pattern_height, color1, color2)
+
+    # partial runs of squares tend to repeat, reuse them:
+    runs = {}
+
+    for row in visible_rows(image, y, board, tilesize):
+
+        # the visible part of the row:
+        y1 = max(y + (row * tilesize), 0)
+        y2 = min(y + (row * tilesize) + tilesize, image.height)
+
+        for start, end, is_hole in board.row_runs(row):
+            x1 = x + (start * tilesize)
+            x2 = x + (end * tilesize)
+
+            # holes:
+            if is_hole:
+                if color0 is not None:
+                    image.paste(color0, (x1, y1, x2, y2))
+
+            # squares:
+            else:
+                # first row is color1 on the first square,
+                # so odd rows start with color2:
+                pattern = pattern_rows[row % 2]
+
+                if start == 0 and end == board.width and y2 - y1 == pattern_height:
+                    run = pattern
+                else:
+                    key = (start, end, row % 2, y2 - y1)
+                    run = runs.get(key)
+
+                    if run is None:
+                        run = pattern.crop((start * tilesize, 0, end * tilesize, y2 - y1))
+
+                        if len(runs) < 64:
+                            runs[key] = run
+
+                image.paste(run, (x1, y1))
+
+
+def repeat_tile(tile, count):
+    """
+    Return an image with a square tile repeated 'count' times horizontally.
+    The filled area is doubled on each paste.
+    """
+    tilesize = tile.width
+
+    image = Image.new(tile.mode, (count * tilesize, tilesize))
+    image.paste(tile, (0, 0))
+
+    filled = 1
+    while filled < count:
+        image.paste(image.crop((0, 0, filled * tilesize, tilesize)), (filled * tilesize, 0))
+        filled *= 2
+
+    return image
+
+
+def mark_runs(coords):
+    """
+    Group (X, Y) coordinates into runs of consecutive squares in the same row.
+    Returns a list of (X, Y, length).
+    """
+    rows = collections.defaultdict(list)
+
+    for col, row in coords:
+        rows[row].append(col)
+
+    runs = []
+
+    for row, cols in rows.items():
+        cols.sort()
+        start = previous = cols[0]
+
+        for col in cols[1:]:
+            if col != previous + 1:
+                runs.append((start, row, previous - start + 1))
+                start = col
+
+            previous = col
+
+        runs.append((start, row, previous - start + 1))
+
+    return runs
+
+
+def mark_rows(coords):
+    """ Like mark_runs(), but returns a dict of Y -> [(X, Y, length)]. """
+    rows = collections.defaultdict(list)
+
+    for col, row, length in mark_runs(coords):
+        rows[row].append((col, row, length))
+
+    return dict(rows)
+
+
+@profiled('marks')
+def draw_marks(image, x, y, board, tilesize, runs, tile, rows = None):
+    """
+    Draw crosses and dots given as runs per row (see: mark_rows()),
+    optionally only in the given 'rows' (a range or a set).
+    'tile' is the mark tile, as returned by generate_tile().
+
+    Consecutive marks in a row are pasted at once from a strip
+    of repeated marks, so dense marks (e.g. heatmaps) need few pastes.
+    """
+    if rows is None:
+        rows = visible_rows(image, y, board, tilesize)
+
+    runs = [run for row in rows for run in runs.get(row, ())]
+
+    if len(runs) == 0:
+        return
+
+    strip = repeat_tile(tile, max(length for col, row, length in runs))
+    strip_mask = strip.getchannel('A')
+
+    # length -> (image, mask):
+    strips = {}
+
+    for col, row, length in runs:
+        if not length in strips:
+            box = (0, 0, length * tilesize, tilesize)
+            strips[length] = (strip.crop(box), strip_mask.crop(box))
+
+        run, mask = strips[length]
+        image.paste(run, (x + (col * tilesize), y + (row * tilesize)), mask)
+
+    profile_count('marks_pasted', sum(length for col, row, length in runs))
+
+
+@profiled('pieces')
+def draw_pieces(image, x, y, board, tilesize, tileset, rows = None):
+    """
+    Draw all the board pieces or only those in the given 'rows'.
+    """
+    if rows is None:
+        rows = visible_rows(image, y, board, tilesize)
+
+    pasted = 0
+
+    for piece, row, col in walk_board_rows(board, ignore_blanks = True, ignore_holes = True, rows = rows):
+        tile, mask = tileset[piece]
+
+        x1 = x + (col * tilesize)
+        y1 = y + (row * tilesize)
+
+        image.paste(tile, (x1, y1), mask)
+        pasted += 1
+
+    profile_count('tiles_pasted', pasted)
+
+
+def row_groups(board, marks, pieces):
+    """
+    Group the board rows that look exactly the same: same parity
+    (checkerboard), holes, marks and pieces (when 'pieces').
+    Returns a dict of row -> (group, count, start, end) for the rows
+    with something drawn on them, where 'count' is the number of marks
+    and pieces and start and end are the columns to copy.
+    """
+    # row -> [(mark index, col)]:
+    marked = collections.defaultdict(list)
+
+    for index, (tile, coords) in enumerate(marks):
+        for col, row in coords:
+            marked[row].append((index, col))
+
+    rows = set(marked)
+
+    if pieces:
+        rows.update(row for _, row, _ in board.pieces)
+
+    # content -> group number:
+    groups = {}
+    result = {}
+
+    for row in rows:
+        content = sorted(marked.get(row, ()))
+
+        if pieces:
+            content.extend((piece, col) for piece, _, col in board.row_pieces(row))
+
+        key = (row % 2, tuple(board.holes[row]), tuple(content))
+        group = groups.setdefault(key, len(groups))
+        cols = [col for _, col in content]
+
+        result[row] = (group, len(content), min(cols), max(cols) + 1)
+
+    return result
+
+
+def repeated_rows(image, y, board, tilesize, groups):
+    """
+    Find the visible board rows that look exactly like a previous one,
+    given their row_groups(). Returns (rows to draw, list of
+    (source row, target rows, start, end)) where start and end
+    are the columns to copy.
+
+    Only rows fully inside the image with at least two pieces or marks
+    are considered, a single tile is cheaper to paste than to copy.
+    """
+    # group -> (source row, target rows, start, end):
+    copies = {}
+    draw = set()
+
+    for row in visible_rows(image, y, board, tilesize):
+        entry = groups.get(row)
+
+        if entry is None:
+            continue
+
+        group, count, start, end = entry
+
+        if count < 2 or y + (row * tilesize) < 0 or y + (row * tilesize) + tilesize > image.height:
+            draw.add(row)
+            continue
+
+        copy = copies.get(group)
+
+        if copy is None:
+            copies[group] = (row, [], start, end)
+            draw.add(row)
+        else:
+            copy[1].append(row)
+
+    repeated = [copy for copy in copies.values() if len(copy[1]) > 0]
+    return draw, repeated
+
+
+@profiled('copy_rows')
+def copy_rows(image, x, y, tilesize, repeated):
+    """ Copy the already drawn rows found by repeated_rows() to their targets. """
+    copied = 0
+
+    for source, targets, start, end in repeated:
+        x1 = x + (start * tilesize)
+        x2 = x + (end * tilesize)
+        y1 = y + (source * tilesize)
+
+        strip = image.crop((x1, y1, x2, y1 + tilesize))
+
+        for row in targets:
+            image.paste(strip, (x1, y + (row * tilesize)))
+            copied += 1
+
+    profile_count('rows_copied', copied)
+
+
+# Parser:
+
+class JobArgumentParser(ArgumentParser):
+    """ An ArgumentParser that raises TileboardError instead of exiting. """
+
+    def error(self, message):
+        raise TileboardError(message)
+
+
+def make_parser(parser_class = ArgumentParser):
+    parser = parser_class(
+        description = __doc__,
+        formatter_class = lambda prog: argparse.HelpFormatter(prog, max_help_position = 50),
+        usage = 'Tileboard.py position filepath [option [options ...]]',
+        epilog  = 'example: Tileboard.py rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR chess.png'
+    )
+
+
+    # required (unless running in batch mode):
+    parser.add_argument('position',
+        help = 'board position in (extended) FEN notation',
+        nargs = '?', type = str)
+
+    parser.add_argument('filepath',
+        help = 'output file including extension',
+        nargs = '?', type = str)
+
+
+    # optional
+    # outer outline options:
+    outer_outline_options = parser.add_argument_group('outer outline options')
+
+    outer_outline_options.add_argument('--outer-outline-color',
+        help = 'color for the outer outline',
+        default = '#000000', dest = 'outer_outline_color', metavar = 'color',
+        type = str)
+
+    outer_outline_options.add_argument('--outer-outline-disable',
+        help = 'do not draw an outer outline',
+        action = 'store_const', dest = 'outer_outline_disable',
+        const = True)
+
+
+    # optional
+    # border options:
+    border_options = parser.add_argument_group('border options')
+
+    border_options.add_argument('--border-color',
+        help = 'color for the border background',
+        default = '#FFFFFF', dest = 'border_color', metavar = 'color',
+        type = str)
+
+    border_options.add_argument('--border-disable',
+        help ='do not draw the coordinates border',
+        action = 'store_const', dest = 'border_disable',
+        const = True)
+
+    border_options.add_argument('--border-uppercase',
+        help = 'use uppercase letters in the border',
+        action = 'store_const', dest = 'border_uppercase',
+        const = True)
+
+    border_options.add_argument('--border-font',
+        help = 'font to use for border letters and numbers',
+        default = 'Font/LiberationMono-Regular.ttf', dest = 'border_font', metavar = 'file.ttf',
+        type = str)
+
+    border_options.add_argument('--border-font-color',
+        help = 'color to use for border letters and numbers',
+        default = '#000000', dest = 'border_font_color', metavar = 'color',
+        type = str)
+
+
+    # optional
+    # inner outline options:
+    inner_outline_options = parser.add_argument_group('inner outline options')
+
+    inner_outline_options.add_argument('--inner-outline-color',
+        help = 'color for the inner outline',
+        default = '#000000', dest = 'inner_outline_color', metavar = 'color',
+        type = str)
+
+    inner_outline_options.add_argument('--inner-outline-disable',
+        help = 'do not draw an inner outline',
+        action = 'store_const', dest = 'inner_outline_disable',
+        const = True)
+
+
+    # optional:
+    # checkerboard options:
+    checkerboard_options = parser.add_argument_group('checkerboard options')
+
+    checkerboard_options.add_argument('--checkerboard-color0',
+        help = 'color for the holes in the board',
+        default = '#EEEEEE', dest = 'checkerboard_color0', metavar = 'color',
+        type = str)
+
+    checkerboard_options.add_argument('--checkerboard-color1',
+        help = 'first color for the checkerboard pattern',
+        default = '#FFCE9E', dest = 'checkerboard_color1', metavar = 'color',
+        type = str)
+
+    checkerboard_options.add_argument('--checkerboard-color2',
+        help = 'second color for the checkerboard pattern',
+        default = '#D18B47', dest = 'checkerboard_color2', metavar = 'color',
+        type = str)
+
+    checkerboard_options.add_argument('--checkerboard-disable',
+        help ='do not draw a checkerboard pattern',
+        action = 'store_const', dest = 'checkerboard_disable',
+        const = True)
+
+    checkerboard_options.add_argument('--checkerboard-holes-disable',
+        help ='do not draw the holes (keep them transparent)',
+        action = 'store_const', dest = 'checkerboard_holes_disable',
+        const = True)
+
+
+    # optional
+    # crosses options:
+    crosses_options = parser.add_argument_group('crosses options')
+
+    crosses_options.add_argument('--crosses',
+        help = 'mark square coordinates with crosses',
+        default = [], dest = 'crosses', metavar = 'coord',
+        nargs = '+', type = str)
+
+    crosses_options.add_argument('--crosses-file',
+        help = 'mark the square coordinates listed in a file with crosses',
+        default = None, dest = 'crosses_file', metavar = 'filepath',
+        type = str)
+
+    crosses_options.add_argument('--crosses-bitboard',
+        help = 'mark the squares in a bitboard (e.g. 0xff00, a1 = bit 0) with crosses',
+        default = None, dest = 'crosses_bitboard', metavar = 'int',
+        type = str)
+
+    crosses_options.add_argument('--crosses-color',
+        help = 'color for the cross markers',
+        default = '#000000', dest = 'crosses_color', metavar = 'color',
+        type = str)
+
+    crosses_options.add_argument('--crosses-disable',
+        help ='do not draw the cross markers',
+        action = 'store_const', dest = 'crosses_disable',
+        const = True)
+
+
+    # optional
+    # dots options:
+    dots_options = parser.add_argument_group('dots options')
+
+    dots_options.add_argument('--dots',
+        help = 'mark square coordinates with dots',
+        default = [], dest = 'dots', metavar = 'coord',
+        nargs = '+', type = str)
+
+    dots_options.add_argument('--dots-file',
+        help = 'mark the square coordinates listed in a file with dots',
+        default = None, dest = 'dots_file', metavar = 'filepath',
+        type = str)
+
+    dots_options.add_argument('--dots-bitboard',
+        help = 'mark the squares in a bitboard (e.g. 0xff00, a1 = bit 0) with dots',
+        default = None, dest = 'dots_bitboard', metavar = 'int',
+        type = str)
+
+    dots_options.add_argument('--dots-color',
+        help = 'color for the dot markers',
+        default = '#000000', dest = 'dots_color', metavar = 'color',
+        type = str)
+
+    dots_options.add_argument('--dots-disable',
+        help ='do not draw the dot markers',
+        action = 'store_const', dest = 'dots_disable',
+        const = True)
+
+
+    # optional
+    # tileset options:
+    tileset_options = parser.add_argument_group('tileset options')
+
+    tileset_options.add_argument('--tileset-folder',
+        help ='folder to look for piece tiles (or a tileset bundle file, see: --pack-tileset)',
+        default = 'Tiles/merida/42', dest = 'tileset_folder', metavar = 'folder',
+        type = str)
+
+    tileset_options.add_argument('--tileset-size',
+        help = 'board square size (resampled if needed when the folder has a subfolder per size, default: 42)',
+        default = None, dest = 'tileset_size', metavar = 'int',
+        type = int)
+
+    tileset_options.add_argument('--tileset-resample-folder',
+        help = 'folder to keep resampled tiles in (default: ~/.cache/Tileboard/tiles)',
+        default = None, dest = 'tileset_resample_folder', metavar = 'folder',
+        type = str)
+
+    tileset_options.add_argument('--pack-tileset',
+        help = 'pack the tiles in a folder (or a folder with a subfolder per size) into a bundle file',
+        default = None, dest = 'pack_tileset', metavar = ('folder', 'filepath'),
+        nargs = 2, type = str)
+
+    tileset_options.add_argument('--tileset-disable',
+        help = 'do not draw tiles',
+        action = 'store_const', dest = 'tileset_disable',
+        const = True)
+
+
+    # optional
+    # animation options:
+    animation_options = parser.add_argument_group('animation options')
+
+    animation_options.add_argument('--positions',
+        help = 'draw an animation with these positions after the first one',
+        default = [], dest = 'positions', metavar = 'position',
+        nargs = '+', type = str)
+
+    animation_options.add_argument('--moves',
+        help = 'draw an animation with these moves (e.g. e2e4 e7e8=Q e1g1,h1f1)',
+        default = [], dest = 'moves', metavar = 'move',
+        nargs = '+', type = str)
+
+    animation_options.add_argument('--frame-duration',
+        help = 'milliseconds per animation frame (default: 1000)',
+        default = 1000, dest = 'frame_duration', metavar = 'int',
+        type = int)
+
+    animation_options.add_argument('--loop',
+        help = 'times to loop the animation, 0 is forever (default: 0)',
+        default = 0, dest = 'loop', metavar = 'int',
+        type = int)
+
+
+    # optional
+    # contact sheet options:
+    sheet_options = parser.add_argument_group('contact sheet options')
+
+    sheet_options.add_argument('--sheet-columns',
+        help = 'draw the position and --positions on a grid with this many columns',
+        default = None, dest = 'sheet_columns', metavar = 'int',
+        type = int)
+
+    sheet_options.add_argument('--sheet-spacing',
+        help = 'pixels between the boards in the grid (default: 10)',
+        default = 10, dest = 'sheet_spacing', metavar = 'int',
+        type = int)
+
+    sheet_options.add_argument('--sheet-labels',
+        help = 'text to draw below each board in the grid',
+        default = [], dest = 'sheet_labels', metavar = 'label',
+        nargs = '+', type = str)
+
+
+    # optional
+    # output options:
+    output_options = parser.add_argument_group('output options')
+
+    output_options.add_argument('--canvas-mode',
+        help = 'image mode to draw in: RGBA, RGB or P (opaque boards only, P up to 256 colors) '
+               'or auto (RGB/P when nothing is lost) (default: RGBA)',
+        default = 'RGBA', dest = 'canvas_mode', metavar = 'mode',
+        choices = ['RGBA', 'RGB', 'P', 'auto'])
+
+    output_options.add_argument('--sizes',
+        help = 'save the board at each of these tile sizes, filepath is a template with {size} (e.g. board-{size}.png)',
+        default = None, dest = 'sizes', metavar = 'int',
+        nargs = '+', type = int)
+
+    output_options.add_argument('--formats',
+        help = 'save the board in each of these formats, filepath is a template with {format} (e.g. board.{format})',
+        default = None, dest = 'formats', metavar = 'format',
+        nargs = '+', type = str)
+
+    output_options.add_argument('--encoder-profile',
+        help = 'encoder settings: fast, balanced or smallest (default: the Pillow defaults)',
+        default = None, dest = 'encoder_profile', metavar = 'profile',
+        choices = list(ENCODER_PROFILES))
+
+    output_options.add_argument('--encoder-benchmark',
+        help = 'encode the board with every profile and print the time and size (saves nothing)',
+        action = 'store_const', dest = 'encoder_benchmark',
+        const = True)
+
+    output_options.add_argument('--profile',
+        help = 'print the time and memory used by each rendering stage to stderr',
+        action = 'store_const', dest = 'profile',
+        const = True)
+
+    output_options.add_argument('--profile-json',
+        help = 'append the time and memory used by each rendering stage to a file, as JSON lines',
+        default = None, dest = 'profile_json', metavar = 'filepath',
+        type = str)
+
+    output_options.add_argument('--memory-budget',
+        help = 'stream PNG images bigger than this many megabytes in bands (default: 1024)',
+        default = 1024, dest = 'memory_budget', metavar = 'int',
+        type = int)
+
+    output_options.add_argument('--parallel',
+        help = 'draw regions of the board using this many processes (default: 1)',
+        default = 1, dest = 'parallel', metavar = 'int',
+        type = int)
+
+    output_options.add_argument('--band-rows',
+        help = 'always stream PNG images, drawing this many board rows at a time',
+        default = None, dest = 'band_rows', metavar = 'int',
+        type = int)
+
+
+    # optional
+    # cache options:
+    cache_options = parser.add_argument_group('cache options')
+
+    cache_options.add_argument('--cache-dir',
+        help = 'reuse previous renders stored in this folder',
+        default = None, dest = 'cache_dir', metavar = 'folder',
+        type = str)
+
+    cache_options.add_argument('--cache-budget',
+        help = 'megabytes to keep in the cache folder (default: 256)',
+        default = 256, dest = 'cache_budget', metavar = 'int',
+        type = int)
+
+
+    # optional
+    # batch options:
+    batch_options = parser.add_argument_group('batch options')
+
+    batch_options.add_argument('--batch',
+        help = 'render the jobs listed in a file (- for stdin), one per line',
+        default = None, dest = 'batch', metavar = 'file',
+        type = str)
+
+    batch_options.add_argument('--batch-output',
+        help = 'output filepath template for EPD lines (default: {index}.png)',
+        default = '{index}.png', dest = 'batch_output', metavar = 'template',
+        type = str)
+
+    batch_options.add_argument('--build',
+        help = 'render the outputs in a manifest (batch format) that changed since the last build '
+               'and delete those no longer listed',
+        default = None, dest = 'build', metavar = 'file',
+        type = str)
+
+    batch_options.add_argument('--build-state',
+        help = 'file to keep the fingerprint of each output in (default: the manifest + .state)',
+        default = None, dest = 'build_state', metavar = 'file',
+        type = str)
+
+    batch_options.add_argument('--tile-cache-budget',
+        help = 'megabytes of decoded tiles to keep in memory (default: 64)',
+        default = 64, dest = 'tile_cache_budget', metavar = 'int',
+        type = int)
+
+    batch_options.add_argument('--jobs',
+        help = 'number of worker processes for batch mode (default: 1)',
+        default = 1, dest = 'jobs', metavar = 'int',
+        type = int)
+
+
+    # optional
+    # server options:
+    server_options = parser.add_argument_group('server options')
+
+    server_options.add_argument('--serve',
+        help = 'serve render requests over HTTP, using --jobs workers',
+        default = None, dest = 'serve', metavar = 'host:port',
+        type = str)
+
+    server_options.add_argument('--serve-cache-budget',
+        help = 'megabytes of encoded responses to cache (default: 64)',
+        default = 64, dest = 'serve_cache_budget', metavar = 'int',
+        type = int)
+
+    return parser
+
+
+# Rendering:
+
+class Layout(object):
+    """
+    The size of every part of the image (outlines, border, squares)
+    for a given board, tile size and options. Computed once per render.
+    """
+    def __init__(self, board, tilesize, options, resources):
+        self.tilesize = tilesize
+
+        # calculate the base image size:
+        self.width = tilesize * board.width
+        self.height = tilesize * board.height
+
+        # add the border and the outlines to the size:
+        self.outer_outline_size = 0
+        self.border_size = 0
+        self.inner_outline_size = 0
+
+        self.border_font = None
+        self.border_font_size = 0
+        self.border_labels = None
+
+        # calculate and add the outer outline size:
+        if not options.outer_outline_disable:
+            self.outer_outline_size = calculate_outline_size(tilesize)
+            self.width += (self.outer_outline_size * 2)
+            self.height += (self.outer_outline_size * 2)
+
+        # calculate and add the border size:
+        if not options.border_disable:
+            self.border_font_size = calculate_border_font_size(tilesize)
+            self.border_font = resources.font(options.border_font, self.border_font_size)
+            self.border_labels = resources.labels()
+            self.border_size = calculate_border_size(board, tilesize, self.border_font)
+            self.width += (self.border_size * 2)
+            self.height += (self.border_size * 2)
+
+        # calculate and add the inner outline size:
+        if not options.inner_outline_disable:
+            self.inner_outline_size = calculate_outline_size(tilesize)
+            self.width += (self.inner_outline_size * 2)
+            self.height += (self.inner_outline_size * 2)
+
+        # where the squares start:
+        self.board_offset = self.outer_outline_size + self.border_size + self.inner_outline_size
+
+
+# board square size when --tileset-size is not given
+# and the tileset doesn't have a single size:
+DEFAULT_TILESET_SIZE = 42
+
+
+def requested_tileset_size(options):
+    """ Return --tileset-size or DEFAULT_TILESET_SIZE when not given. """
+    if options.tileset_size is None:
+        return DEFAULT_TILESET_SIZE
+
+    return options.tileset_size
+
+
+@profiled('load_tileset')
+def board_tileset(board, options, resources):
+    """
+    Return the Tileset for a board, resampling tiles to --tileset-size
+    when the tileset folder is a tileset root or a bundle. Bundles with
+    a single size are only resampled when --tileset-size is given,
+    like tileset folders.
+    """
+    folder = options.tileset_folder
+
+    if is_tileset_root(folder):
+        return resources.tileset(board, folder, requested_tileset_size(options), options.tileset_resample_folder)
+
+    if is_tileset_bundle(folder):
+        size = options.tileset_size
+
+        if size is None:
+            sizes = resources.tiles.bundle(folder, file_signature(folder)).sizes
+            size = sizes[0] if len(sizes) == 1 else DEFAULT_TILESET_SIZE
+
+        return resources.tileset(board, folder, size, options.tileset_resample_folder)
+
+    return resources.tileset(board, folder)
+
+
+# options that are colors, see: validate_options():
+COLOR_OPTIONS = (
+    'outer_outline_color', 'border_color', 'border_font_color', 'inner_outline_color',
+    'checkerboard_color0', 'checkerboard_color1', 'checkerboard_color2',
+    'crosses_color', 'dots_color',
+)
+
+
+def validate_options(options):
+    """
+    Raise TileboardError for colors and sizes that can't be drawn,
+    instead of letting Pillow fail halfway through a render.
+    """
+    for name in COLOR_OPTIONS:
+        parse_color(getattr(options, name), 'RGBA')
+
+    if options.tileset_size is not None and options.tileset_size < 1:
+        raise TileboardError('Invalid tileset size: {}'.format(options.tileset_size))
+
+
+def prepare_board(options, resources, board = None):
+    """
+    Parse the position (unless a Board is given), load the tileset
+    and calculate the layout. Returns (board, tileset, layout).
+    """
+    import_pillow()
+    validate_options(options)
+
+    if board is None:
+        board = Board(options.position)
+
+    tileset = board_tileset(board, options, resources)
+
+    # determine the base tile size:
+    tilesize = tileset.tilesize
+
+    # no tiles on board? fallback to the tilesize specified in options:
+    if tilesize is None:
+        tilesize = requested_tileset_size(options)
+
+    with profile_stage('layout'):
+        layout = Layout(board, tilesize, options, resources)
+
+    return board, tileset, layout
+
+
+def draw_board(image, x, y, board, tileset, layout, options, resources, foreground = None):
+    """
+    Draw a board on an image, with the top-left corner of the board
+    (as given by the layout) at (x, y). Parts outside the image are clipped,
+    which makes it possible to draw just a region of the board.
+    When drawing a board in parts, pass the same 'foreground'
+    (see: Foreground) to each call, so the marks are only parsed once.
+    """
+    draw_background(image, x, y, board, layout, options)
+    draw_foreground(image, x, y, board, tileset, layout, options, resources, foreground)
+
+
+def draw_background(image, x, y, board, layout, options):
+    """
+    Draw everything that doesn't depend on the pieces or marks:
+    outlines, border, holes and checkerboard. See: draw_board().
+    """
+    tilesize = layout.tilesize
+    outer_outline_size = layout.outer_outline_size
+    border_size = layout.border_size
+    inner_outline_size = layout.inner_outline_size
+    border_font = layout.border_font
+    border_font_size = layout.border_font_size
+
+    # bottom-right corner:
+    x2 = x + layout.width - 1
+    y2 = y + layout.height - 1
+
+    # outer outline:
+    if not options.outer_outline_disable:
+        draw_rectangle_outline(image,
+                                  x1 = x,
+                                  y1 = y,
+                                  x2 = x2,
+                                  y2 = y2,
+                               width = outer_outline_size - 1,
+                               color = options.outer_outline_color)
+
+    # border:
+    if not options.border_disable:
+        draw_rectangle_outline(image,
+                                  x1 = x + outer_outline_size,
+                                  y1 = y + outer_outline_size,
+                                  x2 = x2 - outer_outline_size,
+                                  y2 = y2 - outer_outline_size,
+                               width = border_size - 1,
+                               color = options.border_color)
+
+        # border text, top row:
+        top_row_x = x + outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
+        top_row_y = y + outer_outline_size + (border_size // 2) - (border_font_size // 2)
+
+        rows_text = generate_border_rows_text(board.width, options.border_uppercase)
+        cols_text = generate_border_cols_text(board.height)
+
+        # bottom row:
+        bottom_row_x = x + outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
+        bottom_row_y = y + outer_outline_size + border_size + inner_outline_size + (tilesize * board.height) + inner_outline_size + (border_size // 2) - (border_font_size // 2)
+
+        def draw_row(row_x, row_y):
+            draw_horizontal_words(image,
+                                      x = row_x,
+                                      y = row_y,
+                                  words = rows_text,
+                                spacing = tilesize,
+                                   font = border_font,
+                              font_size = border_font_size,
+                             font_color = options.border_font_color,
+                                 labels = layout.border_labels)
+
+        # the top and bottom rows are identical, draw one and copy it when possible:
+        box = measure_words(rows_text, border_font, layout.border_labels)
+
+        if box is not None:
+            top_strip = (0, top_row_y + box[1], image.width, top_row_y + box[3])
+            bottom_strip = (0, bottom_row_y + box[1], image.width, bottom_row_y + box[3])
+
+            if not draw_mirrored(image, top_strip, bottom_strip, lambda: draw_row(top_row_x, top_row_y)):
+                draw_row(top_row_x, top_row_y)
+                draw_row(bottom_row_x, bottom_row_y)
+
+        # border text, left column:
+        left_col_x = x + outer_outline_size + (border_size // 2)
+        left_col_y = y + outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
+
+        # right column:
+        right_col_x = x + outer_outline_size + border_size + inner_outline_size + (tilesize * board.width) + inner_outline_size + (border_size // 2)
+        right_col_y = y + outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
+
+        def draw_col(col_x, col_y):
+            draw_vertical_words(image,
+                                    x = col_x,
+                                    y = col_y,
+                                words = cols_text,
+                              spacing = tilesize,
+                                 font = border_font,
+                            font_size = border_font_size,
+                           font_color = options.border_font_color,
+                               labels = layout.border_labels)
+
+        # same for the left and right columns:
+        box = measure_words(cols_text, border_font, layout.border_labels)
+
+        if box is not None:
+            left_strip = (left_col_x + box[0], 0, left_col_x + box[2], image.height)
+            right_strip = (right_col_x + box[0], 0, right_col_x + box[2], image.height)
+
+            if not draw_mirrored(image, left_strip, right_strip, lambda: draw_col(left_col_x, left_col_y)):
+                draw_col(left_col_x, left_col_y)
+                draw_col(right_col_x, right_col_y)
+
+    # inner outline:
+    if not options.inner_outline_disable:
+        draw_rectangle_outline(image,
+                                  x1 = x + outer_outline_size + border_size,
+                                  y1 = y + outer_outline_size + border_size,
+                                  x2 = x2 - outer_outline_size - border_size,
+                                  y2 = y2 - outer_outline_size - border_size,
+                               width = inner_outline_size - 1,
+                               color = options.inner_outline_color)
+
+    # checkerboard pattern and holes:
+    if not options.checkerboard_disable:
+        if options.checkerboard_holes_disable:
+            holes_color = None
+        else:
+            holes_color = options.checkerboard_color0
+
+        draw_checkerboard(image,
+                              x = x + layout.board_offset,
+                              y = y + layout.board_offset,
+                          board = board,
+                       tilesize = tilesize,
+                         color0 = holes_color,
+                         color1 = options.checkerboard_color1,
+                         color2 = options.checkerboard_color2)
+
+
+def board_marks(board, layout, options, resources):
+    """
+    Return a list of (mark tile, set of (X, Y) coordinates)
+    for the crosses and dots to draw, in drawing order.
+    Mark tiles are only generated when there are marks to draw.
+    """
+    marks = []
+
+    if not options.crosses_disable:
+        coords = parse_marks(board, options.crosses, options.crosses_file, options.crosses_bitboard)
+
+        if len(coords) > 0:
+            tile = resources.mark_tile(layout.tilesize, draw_cross_tile, options.crosses_color)
+            marks.append((tile, coords))
+
+    if not options.dots_disable:
+        coords = parse_marks(board, options.dots, options.dots_file, options.dots_bitboard)
+
+        if len(coords) > 0:
+            tile = resources.mark_tile(layout.tilesize, draw_dot_tile, options.dots_color)
+            marks.append((tile, coords))
+
+    return marks
+
+
+class Foreground(object):
+    """
+    Everything about the marks of a board that can be worked out once
+    per render and shared by all the bands or regions drawn with
+    draw_foreground(): the marks (see: board_marks()), their runs
+    per row (see: mark_rows()) and the groups of identical rows
+    (see: row_groups()).
+    """
+    def __init__(self, board, layout, options, resources):
+        self.marks = board_marks(board, layout, options, resources)
+        self.mark_rows = [(tile, mark_rows(coords)) for tile, coords in self.marks]
+        self.groups = row_groups(board, self.marks, not options.tileset_disable)
+
+
+def draw_foreground(image, x, y, board, tileset, layout, options, resources, foreground = None):
+    """
+    Draw the marks and pieces on top of a background.
+    'foreground' is a Foreground for the board, made when not given.
+    See: draw_board().
+    """
+    tilesize = layout.tilesize
+
+    if foreground is None:
+        foreground = Foreground(board, layout, options, resources)
+
+    # rows identical to a previous one are copied instead of drawn:
+    rows, repeated = repeated_rows(image, y + layout.board_offset, board, tilesize, foreground.groups)
+
+    # crosses and dots:
+    for tile, runs in foreground.mark_rows:
+        draw_marks(image,
+                       x = x + layout.board_offset,
+                       y = y + layout.board_offset,
+                   board = board,
+                tilesize = tilesize,
+                    runs = runs,
+                    tile = tile,
+                    rows = rows)
+
+    # tileset:
+    if not options.tileset_disable:
+        draw_pieces(image,
+                        x = x + layout.board_offset,
+                        y = y + layout.board_offset,
+                    board = board,
+                 tilesize = tilesize,
+                  tileset = tileset,
+                     rows = rows)
+
+    copy_rows(image, x + layout.board_offset, y + layout.board_offset, tilesize, repeated)
+
+
+def render_board(options, resources):
+    """
+    Draw the board described by 'options' and return the resulting image.
+    Tilesets, fonts and mark tiles are taken from 'resources'.
+    """
+    board, tileset, layout = prepare_board(options, resources)
+    return draw_board_canvas(board, tileset, layout, options, resources)
+
+
+def draw_board_canvas(board, tileset, layout, options, resources):
+    """
+    Draw a prepared board (see: prepare_board()) on a new image
+    in the mode given by --canvas-mode, see: canvas_mode().
+    """
+    mode = canvas_mode(board, tileset, layout, options, resources)
+
+    if mode == 'P':
+        palette = make_board_palette(board, tileset, layout, options, resources)
+    else:
+        palette = None
+
+    if options.parallel > 1:
+        image = draw_board_parallel(layout, options, options.parallel,
+            lambda image: convert_canvas(image, mode, palette) if mode != 'RGBA' else image.copy())
+
+    elif mode == 'P':
+        image = draw_board_palette(board, tileset, layout, options, resources, palette)
+
+    else:
+        image = draw_board_image(board, tileset, layout, options, resources, mode)
+
+    if options.canvas_mode == 'auto' and output_extension(options) in PALETTE_EXTENSIONS:
+        image = narrow_to_palette(image)
+
+    profile_canvas(image.width, image.height, image.mode)
+    return image
+
+
+def draw_board_image(board, tileset, layout, options, resources, mode = 'RGBA'):
+    """
+    Draw a board on a new image, starting from a copy of
+    the (cached) background and drawing the marks and pieces on top.
+    'mode' can be RGBA or RGB, see: canvas_mode().
+
+    Backgrounds too big to be cached are drawn on the image itself
+    instead, so that there is only one full-size image in memory.
+    """
+    if not resources.fits_background(layout):
+        image = Image.new(mode, (layout.width, layout.height))
+
+        with profile_stage('background'):
+            draw_background(image, 0, 0, board, layout, options)
+
+    else:
+        background = resources.background(board, layout, options)
+
+        if mode == 'RGBA':
+            image = background.copy()
+        else:
+            image = background.convert(mode)
+
+    draw_foreground(image, 0, 0, board, tileset, layout, options, resources)
+    return image
+
+
+# Canvas modes:
+# (opaque boards don't need an alpha channel and are drawn
+# in RGB or with a palette when requested, see: --canvas-mode)
+
+# formats that can't store transparency:
+OPAQUE_EXTENSIONS = {'.jpg', '.jpeg', '.jpe', '.jfif', '.bmp'}
+
+# formats that can store palette images:
+PALETTE_EXTENSIONS = {'.png', '.gif'}
+
+
+def output_extension(options):
+    """ Return the lowercase extension of the output filepath or None. """
+    if options.filepath is None:
+        return None
+
+    return os.path.splitext(options.filepath)[1].lower()
+
+
+def parse_color(color, mode):
+    """ Like ImageColor.getcolor(), but raising TileboardError. """
+    try:
+        return ImageColor.getcolor(color, mode)
+
+    except ValueError:
+        raise TileboardError('Invalid color: {}'.format(color))
+
+
+def is_opaque_board(board, options):
+    """
+    True when the background covers the whole image with opaque colors,
+    so that the image doesn't need an alpha channel.
+    """
+    if options.checkerboard_disable:
+        return False
+
+    colors = [options.checkerboard_color1, options.checkerboard_color2]
+
+    if not options.outer_outline_disable:
+        colors.append(options.outer_outline_color)
+
+    if not options.border_disable:
+        colors.append(options.border_color)
+
+    if not options.inner_outline_disable:
+        colors.append(options.inner_outline_color)
+
+    if board.has_holes:
+        if options.checkerboard_holes_disable:
+            return False
+
+        colors.append(options.checkerboard_color0)
+
+    return all(parse_color(color, 'RGBA')[3] == 255 for color in colors)
+
+
+def has_partial_alpha(image):
+    """ True when an RGBA image has pixels that are neither opaque nor fully transparent. """
+    histogram = image.getchannel('A').histogram()
+    return any(histogram[1:255])
+
+
+def draws_partial_alpha(board, tileset, layout, options, resources):
+    """
+    True when drawing the pieces and marks of a board would leave
+    partially transparent pixels even on an opaque background.
+
+    Pillow's paste blends the alpha channel too, so the antialiased
+    edges of the tiles are slightly transparent in RGBA images.
+    """
+    pieces = set(walk_board(board, ignore_blanks = True, ignore_holes = True))
+
+    tiles = [tileset[piece][0] for piece in pieces]
+    tiles += [tile for tile, coords in board_marks(board, layout, options, resources)]
+
+    return any(has_partial_alpha(tile) for tile in tiles)
+
+
+def canvas_mode(board, tileset, layout, options, resources):
+    """
+    Return the image mode to draw a board in: RGBA, RGB or P.
+    'auto' uses RGB for formats without transparency and for opaque
+    boards whose RGBA image would be opaque too (no antialiased pieces
+    or marks, see: draws_partial_alpha()).
+    """
+    import_pillow()
+    mode = options.canvas_mode
+
+    if mode == 'auto':
+        if output_extension(options) in OPAQUE_EXTENSIONS:
+            return 'RGB'
+
+        if is_opaque_board(board, options) and not draws_partial_alpha(board, tileset, layout, options, resources):
+            return 'RGB'
+
+        return 'RGBA'
+
+    if mode in ('RGB', 'P') and not is_opaque_board(board, options):
+        raise TileboardError('--canvas-mode {} needs an opaque board '
+            '(opaque colors, a checkerboard and colored holes).'.format(mode))
+
+    return mode
+
+
+class BoardPalette(object):
+    """
+    A palette of up to 256 (R, G, B) colors, whose first 'exact' colors
+    (the board colors) are always kept exactly when quantizing.
+
+    Pillow maps colors to a palette approximately (through a cache with
+    a few bits per channel), so pixels of those colors are fixed afterwards
+    when Pillow doesn't map them to themselves.
+    """
+    def __init__(self, colors, exact):
+        colors = list(colors) + [colors[0]] * (256 - len(colors))
+
+        self.image = Image.new('P', (1, 1))
+        self.image.putpalette([component for color in colors for component in color])
+
+        # (index, color) for the colors Pillow maps elsewhere:
+        self.fixes = []
+
+        for index, color in enumerate(colors[:exact]):
+            sample = Image.new('RGB', (1, 1), color).quantize(palette = self.image, dither = 0)
+
+            if colors[sample.getpixel((0, 0))] != color:
+                self.fixes.append((index, color))
+
+    def getpalette(self):
+        """ Return the palette as a list of 768 integers. """
+        return self.image.getpalette()
+
+    def quantize(self, image):
+        """
+        Convert an RGB image to a 'P' image using this palette.
+        Big images are converted in bands of PALETTE_BAND_BYTES, so the
+        temporary images used to fix colors never cover the whole image.
+        """
+        result = Image.new('P', image.size)
+        result.putpalette(self.getpalette())
+
+        band_height = palette_band_height(image.width)
+
+        for top in range(0, image.height, band_height):
+            band = image.crop((0, top, image.width, min(top + band_height, image.height)))
+            result.paste(self.quantize_band(band), (0, top))
+
+        return result
+
+    def quantize_band(self, image):
+        """ Implementation for quantize(), for a single band. """
+        result = image.quantize(palette = self.image, dither = 0)
+
+        for index, color in self.fixes:
+            difference = ImageChops.difference(image, Image.new('RGB', image.size, color))
+            red, green, blue = difference.split()
+
+            # 255 where the three channels are identical:
+            mask = ImageChops.lighter(ImageChops.lighter(red, green), blue).point(lambda value: 255 if value == 0 else 0)
+            result.paste(index, None, mask)
+
+        return result
+
+
+# bytes of RGB pixels drawn, quantized and streamed at a time
+# for opaque canvases (see: BoardPalette.quantize(), is_streamed_canvas()):
+PALETTE_BAND_BYTES = 4 * 1024 * 1024
+
+
+def palette_band_height(width):
+    """ Return how many rows of an image 'width' pixels wide fit in PALETTE_BAND_BYTES. """
+    return max(1, PALETTE_BAND_BYTES // (width * 3))
+
+
+@profiled('palette')
+def make_board_palette(board, tileset, layout, options, resources):
+    """
+    Return a BoardPalette for a board: the board colors, the border text
+    and the pieces and marks drawn on every kind of square. When there
+    are more than 256 colors the board colors are kept and the rest
+    are quantized.
+    """
+    tilesize = layout.tilesize
+
+    squares = [options.checkerboard_color1, options.checkerboard_color2]
+
+    if board.has_holes:
+        squares.append(options.checkerboard_color0)
+
+    known = list(squares)
+
+    for disabled, color in ((options.outer_outline_disable, options.outer_outline_color),
+                            (options.border_disable, options.border_color),
+                            (options.inner_outline_disable, options.inner_outline_color)):
+        if not disabled:
+            known.append(color)
+
+    known = list(dict.fromkeys(parse_color(color, 'RGB') for color in known))
+
+    # every tile drawn over every kind of square:
+    tiles = [tileset[piece] for piece in sorted(set(walk_board(board, ignore_blanks = True, ignore_holes = True)))]
+    tiles += [(tile, tile.getchannel('A')) for tile, coords in board_marks(board, layout, options, resources)]
+
+    sample = Image.new('RGB', (tilesize * max(1, len(tiles)), (tilesize * len(squares)) + 1))
+
+    for row, square in enumerate(squares):
+        sample.paste(square, (0, row * tilesize, sample.width, (row + 1) * tilesize))
+
+        for col, (tile, mask) in enumerate(tiles):
+            sample.paste(tile, (col * tilesize, row * tilesize), mask)
+
+    # the antialiased border text, every blend of the font color over the border:
+    if not options.border_disable:
+        ramp = Image.frombytes('L', (256, 1), bytes(range(256)))
+
+        strip = Image.new('RGB', (256, 1), parse_color(options.border_color, 'RGB'))
+        strip.paste(options.border_font_color, (0, 0), ramp)
+
+        sample.paste(strip.crop((0, 0, min(256, sample.width), 1)), (0, sample.height - 1))
+
+    colors = sample.getcolors(256)
+
+    if colors is not None:
+        colors = list(dict.fromkeys(known + [color for count, color in colors]))
+
+        if len(colors) <= 256:
+            return BoardPalette(colors, len(known))
+
+    # too many, quantize what isn't a board color:
+    count = 256 - len(known)
+    values = sample.quantize(count).getpalette()[:count * 3]
+
+    return BoardPalette(known + [tuple(values[index:index + 3]) for index in range(0, len(values), 3)], len(known))
+
+
+def convert_canvas(image, mode, palette = None):
+    """ Convert an RGBA image to RGB or P (using a BoardPalette), see: canvas_mode(). """
+    if mode == 'RGBA':
+        return image
+
+    if mode == 'RGB':
+        return image.convert('RGB')
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    return palette.quantize(image)
+
+
+def draw_board_palette(board, tileset, layout, options, resources, palette):
+    """
+    Draw a board on a 'P' image, in RGB bands that are quantized
+    to the palette, so only a band needs four bytes per pixel.
+    """
+    image = Image.new('P', (layout.width, layout.height))
+    image.putpalette(palette.getpalette())
+
+    band_height = palette_band_height(layout.width)
+    foreground = Foreground(board, layout, options, resources)
+
+    for top in range(0, layout.height, band_height):
+        height = min(band_height, layout.height - top)
+
+        band = Image.new('RGB', (layout.width, height))
+        draw_board(band, 0, -top, board, tileset, layout, options, resources, foreground)
+
+        image.paste(palette.quantize_band(band), (0, top))
+
+    return image
+
+
+def narrow_to_palette(image):
+    """
+    Convert an RGB image with 256 colors at most to a 'P' image,
+    without losing anything. Other images are returned unchanged.
+    """
+    if image.mode != 'RGB':
+        return image
+
+    colors = image.getcolors(256)
+
+    if colors is None:
+        return image
+
+    # median cut keeps every color when there are no more than requested:
+    return image.quantize(len(colors))
+
+
+# Animated sequences:
+# (one frame per position, only repainting the squares that change)
+
+def apply_move(board, move):
+    """
+    Return a new Board after a move such as: 'e2e4', 'e2-e4' or 'e7e8=Q'
+    (promotion). Several moves can be done at once, separated by commas
+    (e.g. castling: 'e1g1,h1f1').
+    """
+    rows = [list(row) for row in board.rows]
+
+    for part in move.split(','):
+        match = re.search('^([A-Z]+[0-9]+)-?([A-Z]+[0-9]+)(=.)?$', part, re.IGNORECASE)
+
+        if not match:
+            raise TileboardError('Invalid move: {}'.format(move))
+
+        x1, y1 = parse_position(match.group(1), board)
+        x2, y2 = parse_position(match.group(2), board)
+
+        piece = rows[y1][x1]
+
+        if piece in (' ', '0'):
+            raise TileboardError('No piece to move: {}'.format(move))
+
+        # promotion:
+        if match.group(3) is not None:
+            piece = match.group(3)[1]
+
+        rows[y1][x1] = ' '
+        rows[y2][x2] = piece
+
+    return Board('/'.join(''.join(row) for row in rows))
+
+
+def sequence_boards(options):
+    """
+    Return the boards in a sequence: the starting position followed
+    by either options.positions or a board after each of options.moves.
+    """
+    boards = [Board(options.position)]
+
+    for position in options.positions:
+        boards.append(Board(position))
+
+    for move in options.moves:
+        boards.append(apply_move(boards[-1], move))
+
+    for board in boards:
+        if board.width != boards[0].width or board.height != boards[0].height:
+            raise TileboardError('All the positions must have the same size.')
+
+    return boards
+
+
+def changed_squares(previous, board):
+    """
+    Yields (row, col) for the squares that differ between two boards.
+    Only the pieces and the rows where the holes differ are compared.
+    """
+    squares = set(previous.squares) | set(board.squares)
+
+    for row, (old, new) in enumerate(zip(previous.holes, board.holes)):
+        if old != new:
+            squares.update((row, col) for col in range(board.width))
+
+    for row, col in sorted(squares):
+        if previous.square(row, col) != board.square(row, col):
+            yield row, col
+
+
+@profiled('sequence')
+def render_sequence(options, resources):
+    """
+    Draw a frame for every board in a sequence and return them.
+    The first frame is fully drawn, then each frame is a copy of the
+    previous one with only the changed squares drawn again.
+    """
+    boards = sequence_boards(options)
+
+    board, tileset, layout = prepare_board(options, resources)
+    tilesize = layout.tilesize
+
+    # only the holes change the background, draw it once for all the frames
+    # (and again only when a position has different holes):
+    background = resources.background(board, layout, options)
+    holes = board.holes
+
+    frame = background.copy()
+    draw_foreground(frame, 0, 0, board, tileset, layout, options, resources)
+    frames = [frame]
+
+    # marks are the same in every frame:
+    marks = board_marks(board, layout, options, resources)
+
+    for previous, board in zip(boards, boards[1:]):
+        tileset = board_tileset(board, options, resources)
+
+        if tileset.tilesize is not None and tileset.tilesize != tilesize:
+            raise TileboardError('All the positions must use tiles of the same size.')
+
+        if board.holes != holes:
+            background = resources.background(board, layout, options)
+            holes = board.holes
+
+        frame = frame.copy()
+
+        for row, col in changed_squares(previous, board):
+            x1 = layout.board_offset + (col * tilesize)
+            y1 = layout.board_offset + (row * tilesize)
+            box = (x1, y1, x1 + tilesize, y1 + tilesize)
+
+            # square:
+            frame.paste(background.crop(box), box)
+
+            for tile, coords in marks:
+                if (col, row) in coords:
+                    frame.paste(tile, (x1, y1), tile)
+
+            piece = board.squares.get((row, col))
+
+            if not options.tileset_disable and piece is not None:
+                image, mask = tileset[piece]
+                frame.paste(image, (x1, y1), mask)
+
+        frames.append(frame)
+
+    return frames
+
+
+def save_sequence(options, resources):
+    """
+    Save the frames for a sequence as an animation (GIF, APNG or WebP).
+    The encoders only store the rectangle that changes in each frame.
+    """
+    frames = render_sequence(options, resources)
+
+    save_image(frames[0], options.filepath,
+        save_all = True,
+        append_images = frames[1:],
+        duration = options.frame_duration,
+        loop = options.loop,
+        **save_params(options))
+
+
+def is_sequence(options):
+    """ True when options describe an animated sequence. """
+    if is_sheet(options):
+        return False
+
+    return len(options.positions) > 0 or len(options.moves) > 0
+
+
+# Contact sheets:
+# (many boards drawn on a grid, in a single image)
+
+@profiled('sheet')
+def render_sheet(options, resources):
+    """
+    Draw the starting position and options.positions on a grid
+    with options.sheet_columns columns, optionally with a label
+    below each board. Identical backgrounds are drawn only once.
+    """
+    positions = [options.position] + options.positions
+    labels = options.sheet_labels
+    spacing = options.sheet_spacing
+
+    if options.sheet_columns < 1:
+        raise TileboardError('Invalid number of columns: {}'.format(options.sheet_columns))
+
+    if len(labels) > len(positions):
+        raise TileboardError('More labels than positions.')
+
+    cells = []
+
+    for position in positions:
+        cell_options = make_options(options, position = position)
+        cells.append((cell_options,) + prepare_board(cell_options, resources))
+
+    cell_width = max(layout.width for _, _, _, layout in cells)
+    cell_height = max(layout.height for _, _, _, layout in cells)
+
+    # room for the labels, using the border font:
+    label_font = None
+    label_font_size = 0
+    label_height = 0
+
+    if len(labels) > 0:
+        label_font_size = calculate_border_font_size(max(layout.tilesize for _, _, _, layout in cells))
+        label_font = resources.font(options.border_font, label_font_size)
+        label_height = label_font_size * 2
+
+    columns = min(options.sheet_columns, len(cells))
+    rows = -(-len(cells) // columns)
+
+    width = (columns * cell_width) + ((columns - 1) * spacing)
+    height = (rows * (cell_height + label_height)) + ((rows - 1) * spacing)
+
+    sheet = Image.new('RGBA', (width, height))
+
+    for index, (cell_options, board, tileset, layout) in enumerate(cells):
+        col = index % columns
+        row = index // columns
+
+        # boards are centered horizontally at the top of their cell:
+        x = (col * (cell_width + spacing)) + ((cell_width - layout.width) // 2)
+        y = row * (cell_height + label_height + spacing)
+
+        sheet.paste(resources.background(board, layout, cell_options), (x, y))
+        draw_foreground(sheet, x, y, board, tileset, layout, cell_options, resources)
+
+        if index < len(labels):
+            draw_horizontal_words(sheet,
+                                      x = x + (layout.width // 2),
+                                      y = y + layout.height + (label_font_size // 2),
+                                  words = [labels[index]],
+                                spacing = 0,
+                                   font = label_font,
+                              font_size = label_font_size,
+                             font_color = options.border_font_color,
+                                 labels = resources.labels())
+
+    return sheet
+
+
+def is_sheet(options):
+    """ True when options describe a contact sheet. """
+    return options.sheet_columns is not None
+
+
+# Parallel rendering:
+# (worker processes draw horizontal regions of the same board
+# directly into a shared memory canvas)
+
+# each worker process keeps its own copy of the board and resources:
+region_worker = {}
+
+
+def init_region_worker(canvas_name, options):
+    """ Attach to the shared canvas and prepare the board in a worker process. """
+    from multiprocessing import shared_memory
+
+    resources = ResourceCache()
+    board, tileset, layout = prepare_board(options, resources)
+
+    region_worker['canvas'] = shared_memory.SharedMemory(name = canvas_name)
+    region_worker['options'] = options
+    region_worker['resources'] = resources
+    region_worker['board'] = board
+    region_worker['tileset'] = tileset
+    region_worker['layout'] = layout
+    region_worker['foreground'] = Foreground(board, layout, options, resources)
+
+
+def draw_region(region):
+    """ Draw the rows from 'top' to 'top + height' into the shared canvas. """
+    top, height = region
+    layout = region_worker['layout']
+
+    image = Image.new('RGBA', (layout.width, height))
+    draw_board(image, 0, -top,
+               region_worker['board'],
+               region_worker['tileset'],
+               layout,
+               region_worker['options'],
+               region_worker['resources'],
+               region_worker['foreground'])
+
+    row_bytes = layout.width * 4
+    region_worker['canvas'].buf[top * row_bytes:(top + height) * row_bytes] = image.tobytes()
+
+
+@profiled('parallel')
+def draw_board_parallel(layout, options, processes, consumer):
+    """
+    Draw a board using 'processes' worker processes and call 'consumer'
+    with the resulting image, which is only valid during the call.
+    Returns whatever 'consumer' returns.
+    """
+    import multiprocessing
+    from multiprocessing import shared_memory
+
+    canvas = shared_memory.SharedMemory(create = True, size = max(1, layout.width * layout.height * 4))
+
+    try:
+        # more regions than processes, to balance the work:
+        regions = min(layout.height, processes * 4)
+        region_height = -(-layout.height // regions)
+
+        jobs = [(top, min(region_height, layout.height - top))
+            for top in range(0, layout.height, region_height)]
+
+        with multiprocessing.Pool(processes, init_region_worker, (canvas.name, options)) as pool:
+            pool.map(draw_region, jobs, chunksize = 1)
+
+        image = Image.frombuffer('RGBA', (layout.width, layout.height), canvas.buf, 'raw', 'RGBA', 0, 1)
+
+        try:
+            return consumer(image)
+
+        # release the shared buffer before closing it:
+        finally:
+            del image
+
+    finally:
+        canvas.close()
+        canvas.unlink()
+
+
+# Streaming PNG output:
+# (used to save huge boards without ever holding the full image in memory)
+
+# image mode -> (PNG color type, bytes per pixel):
+PNG_COLOR_TYPES = {
+    'RGBA': (6, 4),
+    'RGB': (2, 3),
+    'P': (3, 1),
+}
+
+
+class PNGStreamWriter(object):
+    """
+    Write an 8-bit RGBA, RGB or palette ('P', using the colors
+    in 'palette', a BoardPalette) PNG incrementally, a band of rows at a time.
+
+    Every row is written with the 'Up' filter (the difference with the row
+    above), computed with Pillow, which compresses checkerboards very well.
+    """
+    def __init__(self, stream, width, height, compress_level = 6, mode = 'RGBA', palette = None, strategy = zlib.Z_DEFAULT_STRATEGY):
+        import_pillow()
+
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self.mode = mode
+
+        self.compressor = zlib.compressobj(compress_level, zlib.DEFLATED, zlib.MAX_WBITS, 8, strategy)
+
+        # last row of the previous band, for the filter:
+        self.previous = None
+
+        color_type, self.pixel_size = PNG_COLOR_TYPES[mode]
+
+        self.stream.write(b'\x89PNG\r\n\x1a\n')
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+        if mode == 'P':
+            self.write_chunk(b'PLTE', bytes(palette.getpalette()[:256 * 3]))
+
+    def write_chunk(self, kind, data):
+        """ Write a PNG chunk, including the length and CRC. """
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+
+        self.stream.write(struct.pack('>I', len(data)))
+        self.stream.write(kind)
+        self.stream.write(data)
+        self.stream.write(struct.pack('>I', crc))
+
+    def write_band(self, band):
+        """ Filter, compress and write an image (in the writer mode) with the next rows. """
+        width, height = band.size
+
+        if width != self.width or self.rows + height > self.height:
+            raise TileboardError('Invalid band size: {}x{}'.format(width, height))
+
+        # palette indexes are filtered like grayscale values:
+        if band.mode == 'P':
+            band = Image.frombytes('L', band.size, band.tobytes())
+
+        # the rows above each row (zeros above the first one):
+        above = Image.new(band.mode, band.size)
+        above.paste(band.crop((0, 0, width, height - 1)), (0, 1))
+
+        if self.previous is not None:
+            above.paste(self.previous, (0, 0))
+
+        data = ImageChops.subtract_modulo(band, above).tobytes()
+        stride = width * self.pixel_size
+
+        # filter type 2 (Up) before every row:
+        raw = b''.join(b'\x02' + data[start:start + stride]
+            for start in range(0, len(data), stride))
+
+        self.write_data(self.compressor.compress(raw))
+
+        self.previous = band.crop((0, height - 1, width, height))
+        self.rows += height
+
+    def write_data(self, data):
+        """ Write compressed data, if any, as an IDAT chunk. """
+        if len(data) > 0:
+            self.write_chunk(b'IDAT', data)
+
+    def close(self):
+        """ Finish the image. All the rows must have been written. """
+        if self.rows != self.height:
+            raise TileboardError('Incomplete image: {} rows of {}'
+                .format(self.rows, self.height))
+
+        self.write_data(self.compressor.flush())
+        self.write_chunk(b'IEND', b'')
+
+
+def calculate_band_height(layout, options):
+    """
+    Return the band height (in pixels) to stream a board with,
+    or None when it should be rendered on a single image.
+    """
+    # only PNG can be streamed:
+    if options.filepath is None or not options.filepath.lower().endswith('.png'):
+        return None
+
+    if options.band_rows is not None:
+        return max(1, options.band_rows * layout.tilesize)
+
+    # parallel rendering needs the full canvas:
+    if options.parallel > 1:
+        return None
+
+    row_bytes = layout.width * 4
+    budget = options.memory_budget * 1024 * 1024
+
+    if layout.height * row_bytes <= budget:
+        return None
+
+    # encoding needs a few copies of each band, leave room for them:
+    return max(1, budget // (row_bytes * 4))
+
+
+def is_streamed_canvas(layout, options, resources):
+    """
+    True when a board drawn with an explicit RGB or P --canvas-mode
+    should be streamed even though it fits options.memory_budget.
+    """
+    return (options.canvas_mode in ('RGB', 'P')
+        and options.parallel <= 1
+        and output_extension(options) == '.png'
+        and not resources.fits_background(layout))
+
+
+@profiled('stream')
+def stream_board(stream, board, tileset, layout, options, resources, band_height, mode = 'RGBA', palette = None):
+    """
+    Draw a board band by band, writing it to 'stream' as a PNG.
+    'mode' is the canvas mode (see: canvas_mode()), P bands are drawn
+    in RGB and quantized to 'palette', a BoardPalette.
+    """
+    params = encoder_params(options.encoder_profile, 'PNG')
+
+    profile_canvas(layout.width, layout.height, mode)
+
+    writer = PNGStreamWriter(stream, layout.width, layout.height,
+        compress_level = params.get('compress_level', 6),
+        mode = mode,
+        palette = palette,
+        strategy = params.get('compress_type', zlib.Z_DEFAULT_STRATEGY))
+
+    foreground = Foreground(board, layout, options, resources)
+
+    for top in range(0, layout.height, band_height):
+        height = min(band_height, layout.height - top)
+
+        band = Image.new('RGBA' if mode == 'RGBA' else 'RGB', (layout.width, height))
+        draw_board(band, 0, -top, board, tileset, layout, options, resources, foreground)
+
+        if mode == 'P':
+            band = palette.quantize(band)
+
+        writer.write_band(band)
+
+    writer.close()
+
+
+def save_board(options, resources):
+    """
+    Draw the board described by 'options' and save it to options.filepath.
+    Boards bigger than options.memory_budget are streamed in bands.
+    When options.cache_dir is set, previous renders are reused.
+    With options.sizes or options.formats, options.filepath is
+    a template for several outputs, see: save_outputs().
+    """
+    if is_multi_output(options):
+        save_outputs(options, resources)
+        return
+
+    if options.cache_dir is None:
+        draw_and_save_board(options, resources)
+        return
+
+    cache = RenderCache(options.cache_dir, options.cache_budget * 1024 * 1024)
+    key = render_cache_key(options)
+    extension = os.path.splitext(options.filepath)[1].lower()
+
+    with profile_stage('render_cache'):
+        found = cache.fetch(key, extension, options.filepath)
+
+    if not found:
+        draw_and_save_board(options, resources)
+
+        with profile_stage('render_cache'):
+            cache.store(key, extension, options.filepath)
+
+
+def draw_and_save_board(options, resources):
+    """ Implementation for save_board(), without the render cache. """
+    if is_svg_output(options) and (is_sequence(options) or is_sheet(options)):
+        raise TileboardError('SVG output is only available for single boards.')
+
+    if is_sequence(options):
+        save_sequence(options, resources)
+        return
+
+    if is_sheet(options):
+        save_image(render_sheet(options, resources), options.filepath, **save_params(options))
+        return
+
+    board, tileset, layout = prepare_board(options, resources)
+    save_prepared_board(board, tileset, layout, options, resources)
+
+
+def save_prepared_board(board, tileset, layout, options, resources):
+    """
+    Draw and save a prepared board (see: prepare_board()),
+    streaming it in bands when it's too big.
+    """
+    if is_svg_output(options):
+        save_svg(board, tileset, layout, options)
+        return
+
+    band_height = calculate_band_height(layout, options)
+
+    # opaque canvases too big to keep a background for are streamed
+    # in small bands, so that they never exist as a whole in memory:
+    if band_height is None and is_streamed_canvas(layout, options, resources):
+        band_height = palette_band_height(layout.width)
+
+    if band_height is None:
+        if options.parallel > 1 and options.canvas_mode == 'RGBA':
+            profile_canvas(layout.width, layout.height, 'RGBA')
+            draw_board_parallel(layout, options, options.parallel,
+                lambda image: save_image(image, options.filepath, **save_params(options)))
+        else:
+            save_image(draw_board_canvas(board, tileset, layout, options, resources), options.filepath, **save_params(options))
+
+        return
+
+    mode = canvas_mode(board, tileset, layout, options, resources)
+
+    if mode == 'P':
+        palette = make_board_palette(board, tileset, layout, options, resources)
+    else:
+        palette = None
+
+    try:
+        with open(options.filepath, 'wb') as stream:
+            stream_board(stream, board, tileset, layout, options, resources, band_height, mode, palette)
+
+    except OSError as err:
+        raise TileboardError('Unable to save image: {}: {}'
+            .format(options.filepath, err))
+
+
+# SVG output:
+# (vector images: every distinct tile is embedded once and referenced
+# with <use>, the checkerboard is a <pattern> and marks are native shapes,
+# written line by line without drawing a canvas)
+
+def is_svg_output(options):
+    """ True when options.filepath is an SVG file. """
+    return output_extension(options) == '.svg'
+
+
+def svg_paint(attribute, color):
+    """ Return an SVG paint attribute (e.g. fill) for a color, with its opacity. """
+    r, g, b, a = parse_color(color, 'RGBA')
+    paint = '{}="#{:02x}{:02x}{:02x}"'.format(attribute, r, g, b)
+
+    if a < 255:
+        paint += ' {}-opacity="{:.3f}"'.format(attribute, a / 255)
+
+    return paint
+
+
+def svg_outline(x1, y1, x2, y2, width, color):
+    """
+    Return a path for a rectangle outline, as drawn by draw_rectangle_outline():
+    'width' + 1 pixels wide, inside the (inclusive) box.
+    """
+    size = width + 1
+    w = x2 - x1 + 1
+    h = y2 - y1 + 1
+
+    return ('<path fill-rule="evenodd" {} d="M{} {}h{}v{}h{}z M{} {}v{}h{}v{}z"/>\n'
+        .format(svg_paint('fill', color), x1, y1, w, h, -w, x1 + size, y1 + size,
+                h - (size * 2), w - (size * 2), -(h - (size * 2))))
+
+
+def svg_words(xs, ys, words, font, color):
+    """
+    Return <text> elements for words, horizontally centered at 'xs'
+    with the top at 'ys' (as in draw_label()).
+    """
+    ascent, _ = font.getmetrics()
+    family, _ = font.getname()
+
+    lines = ['<g font-family="{}, monospace" font-size="{}" text-anchor="middle" {}>\n'
+        .format(html.escape(family), font.size, svg_paint('fill', color))]
+
+    for x, y, word in zip(xs, ys, words):
+        lines.append('<text x="{}" y="{}">{}</text>\n'.format(x, y + ascent, html.escape(word)))
+
+    lines.append('</g>\n')
+    return ''.join(lines)
+
+
+def svg_marks(tilesize, options):
+    """ Return <symbol> elements for the cross and dot marks, see: draw_cross_tile(). """
+    # same geometry as the tiles, which are drawn 4 times bigger:
+    size = tilesize * 4
+
+    offset = (size // 3) / 4
+    length = (size - (size // 3)) / 4
+    width = (size // 10) / 4
+
+    center = (size // 2) / 4
+    radius = (size // 6) / 4
+
+    return (
+        '<symbol id="cross" overflow="visible">'
+        '<path d="M{0} {0}L{1} {1}M{1} {0}L{0} {1}" stroke-width="{2}" {3}/>'
+        '</symbol>\n'
+        '<symbol id="dot" overflow="visible">'
+        '<circle cx="{4}" cy="{4}" r="{5}" {6}/>'
+        '</symbol>\n'
+    ).format(offset, length, width, svg_paint('stroke', options.crosses_color),
+             center, radius, svg_paint('fill', options.dots_color))
+
+
+def svg_board_lines(board, tileset, layout, options):
+    """
+    Yields the lines of an SVG image for a prepared board (see: prepare_board()).
+    The geometry is the same as in draw_background() and draw_foreground().
+    """
+    tilesize = layout.tilesize
+    outer_outline_size = layout.outer_outline_size
+    border_size = layout.border_size
+    inner_outline_size = layout.inner_outline_size
+    border_font_size = layout.border_font_size
+
+    x2 = layout.width - 1
+    y2 = layout.height - 1
+    offset = layout.board_offset
+
+    yield ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+           'width="{0}" height="{1}" viewBox="0 0 {0} {1}">\n'.format(layout.width, layout.height))
+
+    # tiles and marks, once:
+    yield '<defs>\n'
+
+    pieces = {}
+
+    if not options.tileset_disable:
+        for piece in sorted(set(walk_board(board, ignore_blanks = True, ignore_holes = True))):
+            image, mask = tileset[piece]
+            data = base64.b64encode(encode_image(image, 'PNG')).decode('ascii')
+
+            pieces[piece] = 'piece{}'.format(len(pieces))
+
+            yield ('<symbol id="{}" overflow="visible"><image width="{}" height="{}" xlink:href="data:image/png;base64,{}"/></symbol>\n'
+                .format(pieces[piece], tilesize, tilesize, data))
+
+    yield svg_marks(tilesize, options)
+
+    # first square is color1, as in make_checkerboard_rows():
+    yield ('<pattern id="checkerboard" x="{0}" y="{0}" width="{1}" height="{1}" patternUnits="userSpaceOnUse" shape-rendering="crispEdges">'
+           '<rect width="{1}" height="{1}" {3}/>'
+           '<rect width="{2}" height="{2}" {4}/>'
+           '<rect x="{2}" y="{2}" width="{2}" height="{2}" {4}/>'
+           '</pattern>\n'.format(offset, tilesize * 2, tilesize,
+                svg_paint('fill', options.checkerboard_color2),
+                svg_paint('fill', options.checkerboard_color1)))
+
+    yield '</defs>\n'
+
+    # outer outline:
+    if not options.outer_outline_disable:
+        yield svg_outline(0, 0, x2, y2, outer_outline_size - 1, options.outer_outline_color)
+
+    # border and text:
+    if not options.border_disable:
+        yield svg_outline(outer_outline_size, outer_outline_size, x2 - outer_outline_size, y2 - outer_outline_size,
+                          border_size - 1, options.border_color)
+
+        rows_text = generate_border_rows_text(board.width, options.border_uppercase)
+        cols_text = generate_border_cols_text(board.height)
+
+        # top and bottom rows:
+        row_x = offset + (tilesize // 2)
+        top_row_y = outer_outline_size + (border_size // 2) - (border_font_size // 2)
+        bottom_row_y = offset + (tilesize * board.height) + inner_outline_size + (border_size // 2) - (border_font_size // 2)
+
+        xs = [row_x + (tilesize * index) for index in range(board.width)]
+
+        for row_y in (top_row_y, bottom_row_y):
+            yield svg_words(xs, itertools.repeat(row_y), rows_text, layout.border_font, options.border_font_color)
+
+        # left and right columns:
+        left_col_x = outer_outline_size + (border_size // 2)
+        right_col_x = offset + (tilesize * board.width) + inner_outline_size + (border_size // 2)
+        col_y = offset + (tilesize // 2)
+
+        ys = [col_y + (tilesize * index) - (border_font_size // 2) for index in range(board.height)]
+
+        for col_x in (left_col_x, right_col_x):
+            yield svg_words(itertools.repeat(col_x), ys, cols_text, layout.border_font, options.border_font_color)
+
+    # inner outline:
+    if not options.inner_outline_disable:
+        yield svg_outline(outer_outline_size + border_size, outer_outline_size + border_size,
+                          x2 - outer_outline_size - border_size, y2 - outer_outline_size - border_size,
+                          inner_outline_size - 1, options.inner_outline_color)
+
+    # checkerboard, one rect per run of squares, and holes:
+    if not options.checkerboard_disable:
+        if not board.has_holes:
+            yield ('<rect x="{0}" y="{0}" width="{1}" height="{2}" fill="url(#checkerboard)"/>\n'
+                .format(offset, board.width * tilesize, board.height * tilesize))
+
+        else:
+            for row in range(board.height):
+                for start, end, is_hole in board.row_runs(row):
+                    if is_hole and options.checkerboard_holes_disable:
+                        continue
+
+                    fill = svg_paint('fill', options.checkerboard_color0) if is_hole else 'fill="url(#checkerboard)"'
+
+                    yield ('<rect x="{}" y="{}" width="{}" height="{}" {}/>\n'
+                        .format(offset + (start * tilesize), offset + (row * tilesize),
+                                (end - start) * tilesize, tilesize, fill))
+
+    # marks:
+    for name, disabled, squares, filepath, bitboard in (
+        ('cross', options.crosses_disable, options.crosses, options.crosses_file, options.crosses_bitboard),
+        ('dot', options.dots_disable, options.dots, options.dots_file, options.dots_bitboard)):
+
+        if not disabled:
+            for col, row in sorted(parse_marks(board, squares, filepath, bitboard), key = lambda coord: (coord[1], coord[0])):
+                yield ('<use xlink:href="#{}" x="{}" y="{}"/>\n'
+                    .format(name, offset + (col * tilesize), offset + (row * tilesize)))
+
+    # pieces:
+    for piece, row, col in board.pieces:
+        if piece in pieces:
+            yield ('<use xlink:href="#{}" x="{}" y="{}"/>\n'
+                .format(pieces[piece], offset + (col * tilesize), offset + (row * tilesize)))
+
+    yield '</svg>\n'
+
+
+@profiled('svg')
+def save_svg(board, tileset, layout, options):
+    """ Write a prepared board to options.filepath as SVG, see: svg_board_lines(). """
+    try:
+        with open(options.filepath, 'w', encoding = 'utf-8') as stream:
+            for line in svg_board_lines(board, tileset, layout, options):
+                stream.write(line)
+
+    except OSError as err:
+        raise TileboardError('Unable to save image: {}: {}'
+            .format(options.filepath, err))
+
+
+# Multiple sizes and formats:
+# (one position saved at several tile sizes and/or formats in one run,
+# options.filepath is a template, e.g: board-{size}.{format})
+
+def is_multi_output(options):
+    """ True when options describe several outputs, see: save_outputs(). """
+    return options.sizes is not None or options.formats is not None
+
+
+def output_options(options):
+    """
+    Return a complete set of options for every (size, format) output,
+    grouped by size: a list of (size, [options ...]).
+    """
+    sizes = options.sizes if options.sizes is not None else [requested_tileset_size(options)]
+
+    for size in sizes:
+        if size < 1:
+            raise TileboardError('Invalid tileset size: {}'.format(size))
+
+    # tileset folders with a single size can't be resampled,
+    # other sizes can only be drawn when there are no pieces:
+    if options.sizes is not None:
+        folder = options.tileset_folder
+
+        if not is_tileset_root(folder) and not is_tileset_bundle(folder):
+            pieces = render_pieces(options)
+
+            if len(pieces) > 0:
+                tilesize = load_tile(folder, pieces[0]).width
+
+                for size in sizes:
+                    if size != tilesize:
+                        raise TileboardError('--sizes {} needs a tileset folder with a subfolder per size '
+                            'or a tileset bundle, not: {} ({} px tiles)'.format(size, folder, tilesize))
+
+    formats = options.formats if options.formats is not None else [None]
+
+    groups = []
+    filepaths = set()
+
+    # ignore repeated sizes and formats:
+    for size in sorted(set(sizes), key = sizes.index):
+        outputs = []
+
+        for format in sorted(set(formats), key = formats.index):
+            try:
+                filepath = options.filepath.format(size = size, format = format)
+
+            except (KeyError, IndexError, ValueError) as err:
+                raise TileboardError('Invalid output template: {}: {}'
+                    .format(options.filepath, err))
+
+            if filepath in filepaths:
+                raise TileboardError('Output template gives the same filepath for different outputs: {}'
+                    .format(options.filepath))
+
+            filepaths.add(filepath)
+            outputs.append(make_options(options, tileset_size = size, filepath = filepath, sizes = None, formats = None))
+
+        groups.append((size, outputs))
+
+    return groups
+
+
+def save_outputs(options, resources):
+    """
+    Save a position at every size in options.sizes and every format
+    in options.formats. The position is parsed once. Tilesets and layouts
+    are prepared one size at a time, then sizes are drawn and saved
+    concurrently in threads (Pillow releases the GIL when drawing and encoding).
+
+    Animations, contact sheets, the render cache and parallel rendering
+    save one output at a time instead.
+    """
+    groups = output_options(options)
+
+    if is_sequence(options) or is_sheet(options) or options.cache_dir is not None or options.parallel > 1:
+        for size, outputs in groups:
+            for output in outputs:
+                save_board(output, resources)
+        return
+
+    board = Board(options.position)
+    prepared = []
+
+    # loading tiles and fonts uses the shared resources:
+    for size, outputs in groups:
+        _, tileset, layout = prepare_board(outputs[0], resources, board)
+        prepared.append((tileset, layout, outputs))
+
+    # the active Profiler is per thread, threads use their own
+    # and they are merged afterwards:
+    parent = getattr(profiling, 'profiler', None)
+
+    # drawing only uses per-thread resources (backgrounds, mark tiles):
+    def save_group(item):
+        tileset, layout, outputs = item
+        local = ResourceCache(resources.tiles)
+
+        if parent is not None:
+            profiling.profiler = Profiler()
+            profiling.profiler.depth = parent.depth
+
+        try:
+            for output in outputs:
+                save_prepared_board(board, tileset, layout, output, local)
+
+            return getattr(profiling, 'profiler', None)
+
+        finally:
+            profiling.profiler = None
+
+    import concurrent.futures
+
+    workers = min(len(prepared), os.cpu_count() or 1)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for profiler in executor.map(save_group, prepared):
+            if parent is not None:
+                parent.merge(profiler)
+
+
+# Render cache:
+# (a folder with previous renders, named by a hash of everything
+# that affects the output, shared by any number of processes)
+
+# options that don't change the rendered image:
+UNCACHED_OPTIONS = {
+    'filepath', 'batch', 'batch_output', 'build', 'build_state', 'jobs', 'serve', 'serve_cache_budget',
+    'tile_cache_budget', 'memory_budget', 'band_rows', 'parallel', 'cache_dir', 'cache_budget',
+    'tileset_resample_folder', 'encoder_benchmark', 'profile', 'profile_json', 'pack_tileset',
+}
+
+# hash of this file, see: tileboard_signature():
+source_signature = None
+
+
+def tileboard_signature():
+    """ Return a hash of the Tileboard source, so that caches expire on updates. """
+    global source_signature
+
+    if source_signature is None:
+        with open(os.path.abspath(__file__), 'rb') as source:
+            source_signature = hashlib.sha256(source.read()).hexdigest()
+
+    return source_signature
+
+
+def render_pieces(options):
+    """
+    Return the sorted pieces in every board drawn for 'options':
+    the position, options.positions and the boards after each of
+    options.moves (including the pieces that moves promote to).
+    """
+    boards = [Board(options.position)] + [Board(position) for position in options.positions]
+
+    for move in options.moves:
+        boards.append(apply_move(boards[-1], move))
+
+    return sorted(set(piece
+        for board in boards
+            for piece in walk_board(board, ignore_blanks = True, ignore_holes = True)))
+
+
+def render_cache_key(options):
+    """
+    Return a hash of everything that affects the image rendered
+    for 'options': the normalized position, the options, the tiles,
+    font and mark files used (their modification time and size)
+    and Tileboard itself.
+    """
+    board = Board(options.position)
+    pieces = render_pieces(options)
+
+    folder = options.tileset_folder
+
+    if is_tileset_bundle(folder):
+        tiles = [(piece, file_signature(folder)) for piece in pieces]
+
+    else:
+        if is_tileset_root(folder):
+            folder = os.path.join(folder, str(closest_tileset_size(tileset_sizes(folder), requested_tileset_size(options))))
+
+        tiles = [(piece, file_signature(os.path.join(folder, piece_to_filename(piece))))
+            for piece in pieces]
+
+    # the border text and the contact sheet labels:
+    font = None
+    if not options.border_disable or len(options.sheet_labels) > 0:
+        font = file_signature(options.border_font)
+
+    marks = [file_signature(filepath) if filepath is not None else None
+        for filepath in (options.crosses_file, options.dots_file)]
+
+    settings = {name: value for name, value in vars(options).items() if not name in UNCACHED_OPTIONS}
+    settings['position'] = board.position()
+
+    data = json.dumps([tileboard_signature(), settings, tiles, font, marks], sort_keys = True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def copy_file_atomically(source, target):
+    """
+    Copy a file so that 'target' either doesn't change or
+    has the complete contents, never a partial copy.
+    """
+    folder = os.path.dirname(os.path.abspath(target))
+    temporary = os.path.join(folder, temporary_suffix())
+
+    try:
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, target)
+
+    except:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+# file in the render cache folder with the total size of the entries:
+RENDER_CACHE_USAGE = 'usage'
+
+
+class RenderCache(object):
+    """
+    Previous renders, stored in 'folder' by render_cache_key().
+    When the stored files take more than 'budget' bytes, the least
+    recently used ones are removed.
+
+    Entries are copied in and out atomically, so that many processes
+    can share the same folder. Outputs are copies, not hardlinks,
+    so that overwriting an output never changes the cached entry.
+
+    The total size is kept in a file in the folder and updated on every
+    store, the folder is only walked when it goes over budget. Processes
+    storing at the same time may lose an update, which only delays
+    pruning until the next walk finds the real size.
+    """
+    def __init__(self, folder, budget):
+        self.folder = folder
+        self.budget = budget
+        self.usage_path = os.path.join(folder, RENDER_CACHE_USAGE)
+
+    def entry_path(self, key, extension):
+        """ Return the filepath for a cache entry. """
+        return os.path.join(self.folder, key[:2], key + extension)
+
+    def fetch(self, key, extension, filepath):
+        """ Copy a cached entry to 'filepath', returns False when not cached. """
+        entry = self.entry_path(key, extension)
+
+        try:
+            copy_file_atomically(entry, filepath)
+
+            # mark as recently used:
+            os.utime(entry)
+            return True
+
+        # missing or pruned by another process:
+        except OSError:
+            return False
+
+    def store(self, key, extension, filepath):
+        """
+        Add 'filepath' to the cache and prune it when over budget.
+        Storing is best-effort, errors are ignored.
+        """
+        entry = self.entry_path(key, extension)
+
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok = True)
+            copy_file_atomically(filepath, entry)
+
+        # the image was saved, failing to cache it is fine
+        # (counted in the --profile report):
+        except OSError:
+            profile_count('render_cache_write_errors', 1)
+            return
+
+        used = self.read_usage()
+
+        # unknown, walk the folder once:
+        if used is None:
+            self.prune()
+            return
+
+        try:
+            used += os.path.getsize(entry)
+        except OSError:
+            pass
+
+        if used > self.budget:
+            self.prune()
+        else:
+            self.write_usage(used)
+
+    def read_usage(self):
+        """ Return the size recorded by write_usage() or None when unknown. """
+        try:
+            with open(self.usage_path, 'r', encoding = 'utf-8') as descriptor:
+                return int(descriptor.read())
+
+        except (OSError, ValueError):
+            return None
+
+    def write_usage(self, used):
+        """ Record the total size of the entries, atomically. """
+        temporary = os.path.join(self.folder, temporary_suffix())
+
+        # the record is an optimization, failing to write it is fine:
+        try:
+            with open(temporary, 'w', encoding = 'utf-8') as descriptor:
+                descriptor.write(str(used))
+
+            os.replace(temporary, self.usage_path)
+
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def prune(self):
+        """ Remove the least recently used entries until the cache fits the budget. """
+        entries = []
+        used = 0
+
+        for root, folders, filenames in os.walk(self.folder):
+            for filename in filenames:
+                # skip temporary files being written right now:
+                if filename.startswith('.tileboard-'):
+                    continue
+
+                # and the size record:
+                if root == self.folder and filename == RENDER_CACHE_USAGE:
+                    continue
+
+                filepath = os.path.join(root, filename)
+
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, filepath))
+                used += stat.st_size
+
+        entries.sort()
+
+        for _, size, filepath in entries:
+            if used <= self.budget:
+                break
+
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+
+            used -= size
+
+        self.write_usage(used)
+
+
+# Saving and encoding images:
+
+# profile -> Pillow format -> save() parameters:
+# (lossless for every format, JPEG only changes the entropy coding)
+ENCODER_PROFILES = collections.OrderedDict([
+    ('fast', {
+        'PNG': { 'compress_level': 1, 'compress_type': zlib.Z_RLE },
+        'WEBP': { 'lossless': True, 'method': 0, 'quality': 0 },
+    }),
+    ('balanced', {
+        'PNG': { 'compress_level': 6 },
+        'WEBP': { 'lossless': True, 'method': 4, 'quality': 80 },
+    }),
+    ('smallest', {
+        'PNG': { 'compress_level': 9, 'optimize': True },
+        'WEBP': { 'lossless': True, 'method': 6, 'quality': 100 },
+        'JPEG': { 'optimize': True },
+        'GIF': { 'optimize': True },
+    }),
+])
+
+
+def image_format(filepath):
+    """ Return the Pillow format name for a filepath (e.g. 'PNG') or None. """
+    import_pillow()
+    Image.init()
+
+    return Image.EXTENSION.get(os.path.splitext(filepath)[1].lower())
+
+
+def encoder_params(profile, format):
+    """
+    Return the save() parameters for an encoder profile (or None for
+    the Pillow defaults) and a format, see: ENCODER_PROFILES.
+    """
+    if profile is None or format is None:
+        return {}
+
+    return dict(ENCODER_PROFILES[profile].get(format.upper(), {}))
+
+
+def save_params(options):
+    """ Return the save() parameters for options.filepath and options.encoder_profile. """
+    # avoid loading every Pillow plugin (see: image_format()) when there is no profile:
+    if options.encoder_profile is None:
+        return {}
+
+    return encoder_params(options.encoder_profile, image_format(options.filepath))
+
+
+@profiled('save')
+def save_image(image, filepath, **params):
+    """ Save an image to disk, the format is deduced from the filepath. """
+    try:
+        image.save(filepath, **params)
+
+    except Exception as err:
+        raise TileboardError('Unable to save image: {}: {}'
+            .format(filepath, err))
+
+
+@profiled('encode')
+def encode_image(image, format, **params):
+    """ Encode an image in the given format (e.g. 'PNG') and return the bytes. """
+    stream = io.BytesIO()
+
+    try:
+        image.save(stream, format, **params)
+
+    except Exception as err:
+        raise TileboardError('Unable to encode image as: {}: {}'
+            .format(format, err))
+
+    return stream.getvalue()
+
+
+def run_encoder_benchmark(options):
+    """
+    Render a board once and encode it with the Pillow defaults
+    and every encoder profile, in the format of options.filepath,
+    printing the time and size of each. Nothing is saved.
+    """
+    format = image_format(options.filepath)
+
+    if format is None:
+        raise TileboardError('Unknown image format: {}'.format(options.filepath))
+
+    image = Renderer().render_options(options)
+
+    outln('{:<10} {:>10} {:>12}'.format('profile', 'seconds', 'bytes'))
+
+    for profile in [None] + list(ENCODER_PROFILES):
+        start = time.perf_counter()
+        data = encode_image(image, format, **encoder_params(profile, format))
+        elapsed = time.perf_counter() - start
+
+        outln('{:<10} {:>10.3f} {:>12}'.format(profile or 'default', elapsed, len(data)))
+
+
+# Rendering API:
+
+def make_options(defaults = None, **overrides):
+    """
+    Return a complete set of options (an argparse.Namespace) using
+    the values in 'defaults' (or the command-line defaults when None)
+    and replacing those in 'overrides', e.g: tileset_folder = 'Tiles/alpha/30'.
+    """
+    if defaults is None:
+        defaults = make_parser().parse_args([])
+
+    options = argparse.Namespace(**vars(defaults))
+
+    for name, value in overrides.items():
+        if not hasattr(options, name):
+            raise TileboardError('Unknown option: {}'.format(name))
+
+        setattr(options, name, value)
+
+    return options
+
+
+class Renderer(object):
+    """
+    Render board positions to images, without touching the filesystem
+    (other than to load tiles and fonts) and without exiting on errors.
+
+    The keyword arguments are the same options as in the command-line,
+    using the argument names (e.g. border_disable = True) and become the
+    defaults for every render. Tilesets, fonts and mark tiles are kept
+    loaded between renders.
+
+    When given, 'profile_hook' is called after every render with
+    a report of the time and memory used by each stage (see: Profiler).
+    """
+    def __init__(self, profile_hook = None, **options):
+        self.options = make_options(**options)
+        self.resources = ResourceCache()
+        self.profile_hook = profile_hook
+
+    def render_options(self, options):
+        """ Render a complete set of options, as returned by make_options(). """
+        return run_profiled(options, self.profile_hook, render_board, options, self.resources)
+
+    def save_options(self, options):
+        """ Render and save a complete set of options, see: save_board(). """
+        run_profiled(options, self.profile_hook, save_board, options, self.resources)
+
+    def save(self, position, filepath, **options):
+        """ Render a position and save it to 'filepath'. """
+        options = make_options(self.options, position = position, filepath = filepath, **options)
+        self.save_options(options)
+
+    def render_sequence(self, position, **options):
+        """
+        Render an animated sequence (using the 'positions' or 'moves'
+        options) and return a list with an Image for every frame.
+        """
+        options = make_options(self.options, position = position, **options)
+        return run_profiled(options, self.profile_hook, render_sequence, options, self.resources)
+
+    def render_sheet(self, positions, **options):
+        """ Render a list of positions on a grid (see: render_sheet()) and return the Image. """
+        options.setdefault('sheet_columns', len(positions))
+        options = make_options(self.options, position = positions[0], positions = positions[1:], **options)
+
+        return run_profiled(options, self.profile_hook, render_sheet, options, self.resources)
+
+    def render(self, position, format = None, **options):
+        """
+        Render a position. Returns an Image or, when 'format' is given,
+        the image encoded in that format (e.g. 'PNG' or 'SVG') as bytes.
+        """
+        options = make_options(self.options, position = position, **options)
+
+        if format is None:
+            return self.render_options(options)
+
+        return run_profiled(options, self.profile_hook, render_and_encode, options, self.resources, format)
+
+
+def render_and_encode(options, resources, format):
+    """ Render a board and encode it in the given format, see: Renderer.render(). """
+    if format.upper() == 'SVG':
+        board, tileset, layout = prepare_board(options, resources)
+        return ''.join(svg_board_lines(board, tileset, layout, options)).encode('utf-8')
+
+    image = render_board(options, resources)
+    return encode_image(image, format, **encoder_params(options.encoder_profile, format))
+
+
+# module-wide renderer used by render():
+default_renderer = None
+
+
+def render(position, format = None, **options):
+    """
+    Render a position using a module-wide Renderer.
+    See: Renderer.render().
+    """
+    global default_renderer
+
+    if default_renderer is None:
+        default_renderer = Renderer()
+
+    return default_renderer.render(position, format, **options)
+
+
+# Batch rendering:
+# (each line in a batch file is either: position filepath [options ...]
+# or an EPD record, whose output filepath comes from --batch-output)
+
+# each worker process keeps its own parser, options and resources:
+batch_worker = {}
+
+
+def is_epd_line(words):
+    """ True when a batch line looks like an EPD/FEN record. """
+    return len(words) >= 2 and words[1] in ('w', 'b')
+
+
+def parse_epd_id(line):
+    """
+    Return the value of the 'id' opcode in an EPD line or None.
+    Ids are used in output filepaths, so they must be plain filenames.
+    """
+    match = re.search(r'\bid\s+"([^"]*)"', line)
+
+    if not match:
+        return None
+
+    identifier = match.group(1)
+
+    if identifier in ('', '.', '..') or any(character in identifier for character in '/\\\0'):
+        raise TileboardError('Invalid EPD id, not a filename: {}'.format(identifier))
+
+    return identifier
+
+
+def parse_batch_line(parser, defaults, index, line):
+    """
+    Parse a batch line into a complete set of options,
+    using 'defaults' for everything that the line doesn't override.
+    """
+    try:
+        words = shlex.split(line)
+    except ValueError as err:
+        raise TileboardError('Invalid line: {}'.format(err))
+
+    options = argparse.Namespace(**vars(defaults))
+
+    if is_epd_line(words):
+        identifier = parse_epd_id(line)
+
+        if identifier is None:
+            identifier = str(index)
+
+        options.position = words[0]
+        options.filepath = options.batch_output.format(index = index, id = identifier)
+
+    else:
+        options = parser.parse_args(words, namespace = options)
+
+    if options.position is None or options.filepath is None:
+        raise TileboardError('Expected: position filepath [options ...]')
+
+    return options
+
+
+def read_batch_lines(stream):
+    """ Yields (index, line) for all the non-empty, non-comment lines in a stream. """
+    for index, line in enumerate(stream, 1):
+        line = line.strip()
+
+        if line and not line.startswith('#'):
+            yield index, line
+
+
+def init_batch_worker(defaults):
+    """ Prepare the resources shared by all the jobs in a worker process. """
+    batch_worker['parser'] = make_parser(JobArgumentParser)
+    batch_worker['defaults'] = defaults
+    batch_worker['renderer'] = Renderer()
+    tile_cache.budget = defaults.tile_cache_budget * 1024 * 1024
+
+
+def run_batch_job(job):
+    """
+    Render a single batch line.
+    Returns (index, error) where error is None on success.
+    """
+    index, line = job
+
+    try:
+        options = parse_batch_line(batch_worker['parser'], batch_worker['defaults'], index, line)
+        batch_worker['renderer'].save_options(options)
+        return index, None
+
+    # keep failures isolated to their own job:
+    except Exception as err:
+        return index, '{}'.format(err)
+
+
+def run_batch(options):
+    """
+    Render all the jobs in options.batch, using options.jobs processes.
+    Returns the number of failed jobs.
+    """
+    defaults = argparse.Namespace(**vars(options))
+    defaults.batch = None
+
+    if options.jobs < 1:
+        raise TileboardError('Invalid number of jobs: {}'.format(options.jobs))
+
+    if options.batch == '-':
+        stream = sys.stdin
+    else:
+        try:
+            stream = open(options.batch, 'r')
+        except OSError as err:
+            raise TileboardError('Unable to open batch file: {}: {}'
+                .format(options.batch, err))
+
+    failures = 0
+
+    try:
+        for index, error in run_batch_jobs(defaults, read_batch_lines(stream), options.jobs):
+            if error is not None:
+                errln('line {}: {}'.format(index, error))
+                failures += 1
+
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
-    del draw
+    return failures
 
 
-def draw_horizontal_words(image, x, y, words, spacing, font, font_size, font_color):
+def run_batch_jobs(defaults, jobs, processes):
     """
-    Draw a series of words horizontally with a constant spacing.
+    Render (index, line) jobs using 'processes' worker processes.
+    Yields (index, error) as each job finishes, see: run_batch_job().
     """
-    draw = ImageDraw.Draw(image)
+    if processes == 1:
+        init_batch_worker(defaults)
+        yield from map(run_batch_job, jobs)
+        return
 
-    # draw:
-    for index, word in enumerate(words):
-        fontwidth, _ = font.getsize(word)
+    import multiprocessing
 
-        x1 = x + (spacing * index) - (fontwidth // 2)
-        y1 = y
+    # feed the pool a bounded block at a time, so that huge inputs
+    # are never read into memory all at once:
+    block_size = processes * 256
 
-        draw.text((x1, y1), word, font = font, fill = font_color)
+    with multiprocessing.Pool(processes, init_batch_worker, (defaults,)) as pool:
+        while True:
+            block = list(itertools.islice(jobs, block_size))
+            if not block:
+                break
 
-    del draw
+            yield from pool.imap_unordered(run_batch_job, block, chunksize = 16)
+
+
+# Incremental builds:
+# (a manifest in the batch format, rendering only the outputs whose
+# fingerprint changed since the last build and deleting those no longer listed)
 
+def build_outputs(options):
+    """ Return the filepaths written by a set of options. """
+    if is_multi_output(options):
+        return [output.filepath for size, outputs in output_options(options) for output in outputs]
 
-def draw_vertical_words(image, x, y, words, spacing, font, font_size, font_color):
+    return [options.filepath]
+
+
+def build_fingerprint(options):
     """
-    Draw a series of words vertically with a constant spacing.
+    Return a hash of everything an output depends on: the position and options,
+    the tiles used, the font, mark files and Tileboard itself (see: render_cache_key()).
     """
-    draw = ImageDraw.Draw(image)
+    if is_multi_output(options):
+        keys = [render_cache_key(output) for size, outputs in output_options(options) for output in outputs]
+    else:
+        keys = [render_cache_key(options)]
 
-    # draw:
-    for index, word in enumerate(words):
-        fontwidth, _ = font.getsize(word)
+    return hashlib.sha256(json.dumps(keys).encode('utf-8')).hexdigest()
 
-        x1 = x - (fontwidth // 2)
-        y1 = y + (spacing * index) - (font_size // 2)
 
-        draw.text((x1, y1), word, font = font, fill = font_color)
+def load_build_state(filepath):
+    """ Return the {output filepath: fingerprint} recorded by a previous build. """
+    try:
+        with open(filepath, 'r', encoding = 'utf-8') as descriptor:
+            return json.load(descriptor)['outputs']
 
-    del draw
+    except FileNotFoundError:
+        return {}
 
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        raise TileboardError('Unable to read build state: {}: {}'
+            .format(filepath, err))
 
-# Specific drawing helpers for the board itself:
-# (have board specific information)
 
-def draw_checkerboard_holes(image, x, y, board, tilesize, color):
-    """
-    Draw the checkerboard holes.
-    """
-    draw = ImageDraw.Draw(image)
+def save_build_state(filepath, outputs):
+    """ Write the {output filepath: fingerprint} of a build, atomically. """
+    temporary = filepath + temporary_suffix()
 
-    for tile, row, col in walk_board_rows(board, ignore_blanks = True, ignore_holes = False):
-        x1 = x + (col * tilesize)
-        y1 = y + (row * tilesize)
-        x2 = x1 + tilesize - 1
-        y2 = y1 + tilesize - 1
+    try:
+        with open(temporary, 'w', encoding = 'utf-8') as descriptor:
+            json.dump({ 'outputs': outputs }, descriptor, indent = 4, sort_keys = True)
+            descriptor.write('\n')
 
-        if tile == '0':
-            draw.rectangle([x1, y1, x2, y2], color)
+        os.replace(temporary, filepath)
 
-    del draw
+    except OSError as err:
+        raise TileboardError('Unable to write build state: {}: {}'
+            .format(filepath, err))
 
 
-def draw_checkerboard_pattern(image, x, y, board, tilesize, color1, color2):
+def run_build(options):
     """
-    Draw the checkerboard pattern.
+    Build the outputs listed in the options.build manifest, using
+    options.jobs processes. Outputs are only rendered when missing or when
+    their fingerprint differs from the one in the build state file.
+    Outputs from a previous build that are no longer listed are deleted
+    (unless some lines fail to parse). Returns the number of failures.
     """
-    draw = ImageDraw.Draw(image)
+    defaults = argparse.Namespace(**vars(options))
+    defaults.build = None
 
-    for tile, row, col in walk_board_rows(board, ignore_blanks = False, ignore_holes = True):
-        x1 = x + (col * tilesize)
-        y1 = y + (row * tilesize)
-        x2 = x1 + tilesize - 1
-        y2 = y1 + tilesize - 1
+    if options.jobs < 1:
+        raise TileboardError('Invalid number of jobs: {}'.format(options.jobs))
 
-        if (col % 2) == (row % 2):
-            draw.rectangle([x1, y1, x2, y2], color1)
+    state_filepath = options.build_state
+
+    if state_filepath is None:
+        state_filepath = options.build + '.state'
+
+    previous = load_build_state(state_filepath)
+    parser = make_parser(JobArgumentParser)
+
+    # output filepath -> fingerprint, line index -> outputs:
+    current = {}
+    pending = {}
+
+    jobs = []
+    up_to_date = 0
+    failures = 0
+    invalid = False
+
+    try:
+        with open(options.build, 'r') as stream:
+            lines = list(read_batch_lines(stream))
+
+    except OSError as err:
+        raise TileboardError('Unable to open manifest: {}: {}'
+            .format(options.build, err))
+
+    for index, line in lines:
+        try:
+            entry = parse_batch_line(parser, defaults, index, line)
+            outputs = [os.path.normpath(filepath) for filepath in build_outputs(entry)]
+            fingerprint = build_fingerprint(entry)
+
+            for filepath in outputs:
+                if filepath in current:
+                    raise TileboardError('Output listed more than once: {}'.format(filepath))
+
+        except TileboardError as err:
+            errln('line {}: {}'.format(index, err))
+            failures += 1
+            invalid = True
+            continue
+
+        for filepath in outputs:
+            current[filepath] = fingerprint
+
+        if any(previous.get(filepath) != fingerprint or not os.path.isfile(filepath) for filepath in outputs):
+            jobs.append((index, line))
+            pending[index] = outputs
         else:
-            draw.rectangle([x1, y1, x2, y2], color2)
+            up_to_date += 1
 
-    del draw
+    rendered = 0
 
+    for index, error in run_batch_jobs(defaults, iter(jobs), options.jobs):
+        if error is None:
+            rendered += 1
+            continue
 
-def draw_marks(image, x, y, board, tilesize, coords, color, drawing_function):
-    """
-    Draw crosses and dots on the given board coordinates.
-    """
-    tile = generate_tile(tilesize, drawing_function, color, factor = 4)
-    mask = tile.split()[3]
+        errln('line {}: {}'.format(index, error))
+        failures += 1
 
-    for col, row in parse_positions(coords, board):
-        x1 = x + (col * tilesize)
-        y1 = y + (row * tilesize)
+        # render it again next time:
+        for filepath in pending[index]:
+            current[filepath] = None
 
-        image.paste(tile, (x1, y1), mask)
+    deleted = 0
+
+    for filepath in previous:
+        if filepath in current:
+            continue
+
+        # keep what we don't know about, it may still be listed:
+        if invalid:
+            current[filepath] = previous[filepath]
+            continue
+
+        try:
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+                deleted += 1
+
+        except OSError as err:
+            errln('Unable to delete: {}: {}'.format(filepath, err))
+            failures += 1
+            current[filepath] = previous[filepath]
 
+    save_build_state(state_filepath, { filepath: fingerprint
+        for filepath, fingerprint in current.items() if fingerprint is not None })
 
-def draw_pieces(image, x, y, board, tilesize, tileset):
+    outln('Rendered: {}, up to date: {}, deleted: {}, failed: {}'
+        .format(rendered, up_to_date, deleted, failures))
+
+    return failures
+
+
+# Render server:
+# (GET /?position=...&format=png&dots=e4,e5&border-disable
+# or POST / with the same parameters as a JSON object)
+
+# options that only make sense in the command-line:
+SERVER_IGNORED_OPTIONS = {
+    'position', 'filepath', 'batch', 'batch_output', 'build', 'build_state', 'jobs', 'serve', 'serve_cache_budget',
+    'tile_cache_budget', 'memory_budget', 'band_rows', 'parallel', 'cache_dir', 'cache_budget',
+    'tileset_resample_folder', 'encoder_benchmark', 'profile', 'profile_json', 'pack_tileset',
+    'sizes', 'formats',
+}
+
+# options that are filepaths, restricted to the current folder:
+SERVER_FILEPATH_OPTIONS = {'border_font', 'tileset_folder', 'crosses_file', 'dots_file'}
+
+
+def parse_server_address(address):
+    """ Parse 'host:port' into a (host, port) tuple. """
+    host, _, port = address.rpartition(':')
+
+    try:
+        return host, int(port)
+    except ValueError:
+        raise TileboardError('Invalid server address: {}'.format(address))
+
+
+def is_safe_relative_path(filepath):
+    """ True when a filepath is relative and doesn't leave the current folder. """
+    if os.path.isabs(filepath) or os.path.splitdrive(filepath)[0]:
+        return False
+
+    return not '..' in filepath.replace('\\', '/').split('/')
+
+
+def parse_server_params(parser, defaults, params):
     """
-    Draw all the board pieces.
+    Convert request parameters (a dict of name -> value or list of values)
+    to (options, format) where format is a Pillow format name (e.g. 'PNG').
+    Names can use dashes or underscores, flags are enabled with
+    an empty value, 1, true, yes or on.
     """
-    for piece, row, col in walk_board_rows(board, ignore_blanks = True, ignore_holes = True):
-        tile = tileset[piece]
-        mask = tile.split()[3]
+    actions = {action.dest: action for action in parser._actions}
 
-        x1 = x + (col * tilesize)
-        y1 = y + (row * tilesize)
+    position = None
+    format = 'png'
+    words = []
 
-        image.paste(tile, (x1, y1), mask)
+    # options given in the request (not the server defaults):
+    supplied = set()
 
+    for name, value in params.items():
+        name = name.replace('-', '_')
 
-# Parser:
+        if not isinstance(value, list):
+            value = [value]
 
-def make_parser():
-    parser = ArgumentParser(
-        description = __doc__,
-        formatter_class = lambda prog: argparse.HelpFormatter(prog, max_help_position = 50),
-        usage = 'Tileboard.py position filepath [option [options ...]]',
-        epilog  = 'example: Tileboard.py rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR chess.png'
-    )
+        if name == 'position':
+            position = str(value[-1])
+            continue
 
+        if name == 'format':
+            format = str(value[-1]).lower()
+            continue
 
-    # required:
-    parser.add_argument('position',
-        help = 'board position in (extended) FEN notation',
-        type = str)
+        action = actions.get(name)
 
-    parser.add_argument('filepath',
-        help = 'output file including extension',
-        type = str)
+        if action is None or name in SERVER_IGNORED_OPTIONS or name == 'help':
+            raise TileboardError('Unknown option: {}'.format(name))
 
+        supplied.add(name)
 
-    # optional
-    # outer outline options:
-    outer_outline_options = parser.add_argument_group('outer outline options')
+        # flags:
+        if action.nargs == 0:
+            if str(value[-1]).lower() in ('', '1', 'true', 'yes', 'on'):
+                words.append(action.option_strings[0])
 
-    outer_outline_options.add_argument('--outer-outline-color',
-        help = 'color for the outer outline',
-        default = '#000000', dest = 'outer_outline_color', metavar = 'color',
-        type = str)
+        # lists, either repeated or comma separated:
+        elif action.nargs == '+':
+            items = [item for text in value for item in str(text).split(',') if item]
 
-    outer_outline_options.add_argument('--outer-outline-disable',
-        help = 'do not draw an outer outline',
-        action = 'store_const', dest = 'outer_outline_disable',
-        const = True)
+            if len(items) > 0:
+                words.append(action.option_strings[0])
+                words.extend(items)
 
+        else:
+            words.extend([action.option_strings[0], str(value[-1])])
 
-    # optional
-    # border options:
-    border_options = parser.add_argument_group('border options')
+    if position is None:
+        raise TileboardError('Missing parameter: position')
 
-    border_options.add_argument('--border-color',
-        help = 'color for the border background',
-        default = '#FFFFFF', dest = 'border_color', metavar = 'color',
-        type = str)
+    # e.g. jpg -> JPEG:
+    import_pillow()
+    Image.init()
+    name = Image.EXTENSION.get('.' + format)
 
-    border_options.add_argument('--border-disable',
-        help ='do not draw the coordinates border',
-        action = 'store_const', dest = 'border_disable',
-        const = True)
+    if name is None or not name in Image.SAVE:
+        raise TileboardError('Unsupported format: {}'.format(format))
 
-    border_options.add_argument('--border-uppercase',
-        help = 'use uppercase letters in the border',
-        action = 'store_const', dest = 'border_uppercase',
-        const = True)
+    options = argparse.Namespace(**vars(defaults))
+    options = parser.parse_args(words + ['--', position, 'image'], namespace = options)
 
-    border_options.add_argument('--border-font',
-        help = 'font to use for border letters and numbers',
-        default = 'Font/LiberationMono-Regular.ttf', dest = 'border_font', metavar = 'file.ttf',
-        type = str)
+    # the operator's own defaults can be anywhere:
+    for option in SERVER_FILEPATH_OPTIONS & supplied:
+        if getattr(options, option) is not None and not is_safe_relative_path(getattr(options, option)):
+            raise TileboardError('Invalid {}: {}'.format(option, getattr(options, option)))
 
-    border_options.add_argument('--border-font-color',
-        help = 'color to use for border letters and numbers',
-        default = '#000000', dest = 'border_font_color', metavar = 'color',
-        type = str)
+    return options, name
 
 
-    # optional
-    # inner outline options:
-    inner_outline_options = parser.add_argument_group('inner outline options')
+def run_server_job(job):
+    """ Render (options, format) in a worker, returns the encoded bytes. """
+    options, format = job
+    image = batch_worker['renderer'].render_options(options)
 
-    inner_outline_options.add_argument('--inner-outline-color',
-        help = 'color for the inner outline',
-        default = '#000000', dest = 'inner_outline_color', metavar = 'color',
-        type = str)
+    return encode_image(image, format, **encoder_params(options.encoder_profile, format))
 
-    inner_outline_options.add_argument('--inner-outline-disable',
-        help = 'do not draw an inner outline',
-        action = 'store_const', dest = 'inner_outline_disable',
-        const = True)
 
+class ResponseCache(object):
+    """
+    An LRU cache of encoded images, keyed by the normalized request,
+    that keeps up to 'budget' bytes.
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.responses = collections.OrderedDict()
 
-    # optional:
-    # checkerboard options:
-    checkerboard_options = parser.add_argument_group('checkerboard options')
+    def get(self, key):
+        """ Return the cached (body, etag) for a key or None. """
+        response = self.responses.get(key)
 
-    checkerboard_options.add_argument('--checkerboard-color0',
-        help = 'color for the holes in the board',
-        default = '#EEEEEE', dest = 'checkerboard_color0', metavar = 'color',
-        type = str)
+        if response is not None:
+            self.responses.move_to_end(key)
 
-    checkerboard_options.add_argument('--checkerboard-color1',
-        help = 'first color for the checkerboard pattern',
-        default = '#FFCE9E', dest = 'checkerboard_color1', metavar = 'color',
-        type = str)
+        return response
 
-    checkerboard_options.add_argument('--checkerboard-color2',
-        help = 'second color for the checkerboard pattern',
-        default = '#D18B47', dest = 'checkerboard_color2', metavar = 'color',
-        type = str)
+    def put(self, key, response):
+        """ Add a (body, etag) response, evicting old ones as needed. """
+        body, _ = response
 
-    checkerboard_options.add_argument('--checkerboard-disable',
-        help ='do not draw a checkerboard pattern',
-        action = 'store_const', dest = 'checkerboard_disable',
-        const = True)
+        if key in self.responses or len(body) > self.budget:
+            return
 
-    checkerboard_options.add_argument('--checkerboard-holes-disable',
-        help ='do not draw the holes (keep them transparent)',
-        action = 'store_const', dest = 'checkerboard_holes_disable',
-        const = True)
+        self.responses[key] = response
+        self.used += len(body)
 
+        while self.used > self.budget:
+            _, (old_body, _) = self.responses.popitem(last = False)
+            self.used -= len(old_body)
 
-    # optional
-    # crosses options:
-    crosses_options = parser.add_argument_group('crosses options')
 
-    crosses_options.add_argument('--crosses',
-        help = 'mark square coordinates with crosses',
-        default = [], dest = 'crosses', metavar = 'coord',
-        nargs = '+', type = str)
+class RenderService(object):
+    """
+    Render requests using a worker pool, caching the responses and
+    coalescing identical requests that arrive at the same time.
+    """
+    def __init__(self, defaults):
+        import concurrent.futures
 
-    crosses_options.add_argument('--crosses-color',
-        help = 'color for the cross markers',
-        default = '#000000', dest = 'crosses_color', metavar = 'color',
-        type = str)
+        self.parser = make_parser(JobArgumentParser)
+        self.defaults = defaults
+        self.cache = ResponseCache(defaults.serve_cache_budget * 1024 * 1024)
 
-    crosses_options.add_argument('--crosses-disable',
-        help ='do not draw the cross markers',
-        action = 'store_const', dest = 'crosses_disable',
-        const = True)
+        # requests being rendered right now, key -> Future:
+        self.pending = {}
 
+        # reentrant, done callbacks may run right away when added:
+        self.lock = threading.RLock()
 
-    # optional
-    # dots options:
-    dots_options = parser.add_argument_group('dots options')
+        if defaults.jobs > 1:
+            self.executor = concurrent.futures.ProcessPoolExecutor(defaults.jobs, initializer = init_batch_worker, initargs = (defaults,))
+        else:
+            init_batch_worker(defaults)
+            self.executor = concurrent.futures.ThreadPoolExecutor(1)
 
-    dots_options.add_argument('--dots',
-        help = 'mark square coordinates with dots',
-        default = [], dest = 'dots', metavar = 'coord',
-        nargs = '+', type = str)
+    def request_key(self, options, format):
+        """
+        Return a key for a request: the normalized position and settings,
+        the tiles, font and mark files used, and the output format.
+        """
+        return render_cache_key(options), format
 
-    dots_options.add_argument('--dots-color',
-        help = 'color for the dot markers',
-        default = '#000000', dest = 'dots_color', metavar = 'color',
-        type = str)
+    def render(self, params):
+        """ Return (body, etag, content type) for some request parameters. """
+        options, format = parse_server_params(self.parser, self.defaults, params)
+        key = self.request_key(options, format)
 
-    dots_options.add_argument('--dots-disable',
-        help ='do not draw the dot markers',
-        action = 'store_const', dest = 'dots_disable',
-        const = True)
+        with self.lock:
+            response = self.cache.get(key)
 
+            if response is None:
+                future = self.pending.get(key)
 
-    # optional
-    # tileset options:
-    tileset_options = parser.add_argument_group('tileset options')
+                # first one, render:
+                if future is None:
+                    future = self.executor.submit(run_server_job, (options, format))
+                    self.pending[key] = future
+                    future.add_done_callback(lambda future: self.finish(key, future))
 
-    tileset_options.add_argument('--tileset-folder',
-        help ='folder to look for piece tiles',
-        default = 'Tiles/merida/42', dest = 'tileset_folder', metavar = 'folder',
-        type = str)
+        if response is None:
+            body = future.result()
+            response = (body, make_etag(body))
 
-    tileset_options.add_argument('--tileset-size',
-        help = 'board square size',
-        default = 42, dest = 'tileset_size', metavar = 'int',
-        type = int)
+        body, etag = response
+        return body, etag, Image.MIME.get(format, 'application/octet-stream')
 
-    tileset_options.add_argument('--tileset-disable',
-        help = 'do not draw tiles',
-        action = 'store_const', dest = 'tileset_disable',
-        const = True)
+    def finish(self, key, future):
+        """ Cache a finished render and stop coalescing requests for it. """
+        with self.lock:
+            del self.pending[key]
 
-    return parser
+            if future.exception() is None:
+                body = future.result()
+                self.cache.put(key, (body, make_etag(body)))
 
+    def shutdown(self):
+        self.executor.shutdown()
 
-# Entry point:
 
-def main():
-    parser = make_parser()
-    options = parser.parse_args()
-    status = 0
+def make_etag(body):
+    """ Return a strong ETag for a response body. """
+    return '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
 
-    try:
-        # load resources:
-        board = Board(options.position)
-        tileset = load_tileset(board, options.tileset_folder)
 
-        # determine the base tile size:
-        tilesize = validate_tile_sizes(tileset.values())
+class RenderRequestHandler(object):
+    """
+    Handle GET (query string) and POST (JSON) render requests.
+    Mixed with http.server.BaseHTTPRequestHandler in make_server(),
+    so that http.server is only imported when serving.
+    """
 
-        # no tiles on board? fallback to the tilesize specified in options:
-        if tilesize is None:
-            tilesize = options.tileset_size
+    def do_GET(self):
+        import urllib.parse
 
-        # calculate the base image size:
-        image_width = tilesize * board.width
-        image_height = tilesize * board.height
+        query = urllib.parse.urlsplit(self.path).query
+        params = urllib.parse.parse_qs(query, keep_blank_values = True)
 
-        # add the border and the outlines to the size:
-        outer_outline_size = 0
-        border_size = 0
-        inner_outline_size = 0
+        self.respond(params)
 
-        # calculate and add the outer outline size:
-        if not options.outer_outline_disable:
-            outer_outline_size = calculate_outline_size(tilesize)
-            image_width += (outer_outline_size * 2)
-            image_height += (outer_outline_size * 2)
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length).decode('utf-8'))
 
-        # calculate and add the border size:
-        if not options.border_disable:
-            border_font_size = calculate_border_font_size(tilesize)
-            border_font = load_font(options.border_font, border_font_size)
-            border_size = calculate_border_size(board, tilesize, border_font)
-            image_width += (border_size * 2)
-            image_height += (border_size * 2)
+            if not isinstance(params, dict):
+                raise ValueError('expected a JSON object')
 
-        # calculate and add the inner outline size:
-        if not options.inner_outline_disable:
-            inner_outline_size = calculate_outline_size(tilesize)
-            image_width += (inner_outline_size * 2)
-            image_height += (inner_outline_size * 2)
+        except ValueError as err:
+            self.send_text(400, 'Invalid JSON: {}'.format(err))
+            return
 
+        self.respond(params)
 
-        # create the base image, transparent
-        # and start drawing:
-        image = Image.new('RGBA', (image_width, image_height))
+    def respond(self, params):
+        try:
+            body, etag, content_type = self.server.service.render(params)
 
-        # outer outline:
-        if not options.outer_outline_disable:
-            draw_rectangle_outline(image,
-                                      x1 = 0,
-                                      y1 = 0,
-                                      x2 = image.width - 1,
-                                      y2 = image.height - 1,
-                                   width = outer_outline_size - 1,
-                                   color = options.outer_outline_color)
-
-        # border:
-        if not options.border_disable:
-            draw_rectangle_outline(image,
-                                      x1 = outer_outline_size,
-                                      y1 = outer_outline_size,
-                                      x2 = image.width - outer_outline_size - 1,
-                                      y2 = image.height - outer_outline_size - 1,
-                                   width = border_size - 1,
-                                   color = options.border_color)
-
-            # border text, top row:
-            top_row_x = outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
-            top_row_y = outer_outline_size + (border_size // 2) - (border_font_size // 2)
+        except TileboardError as err:
+            self.send_text(400, '{}'.format(err))
+            return
 
-            draw_horizontal_words(image,
-                                      x = top_row_x,
-                                      y = top_row_y,
-                                  words = generate_border_rows_text(board, options.border_uppercase),
-                                spacing = tilesize,
-                                   font = border_font,
-                              font_size = border_font_size,
-                             font_color = options.border_font_color)
+        except Exception as err:
+            self.send_text(500, '{}'.format(err))
+            return
 
-            # border text, bottom row:
-            bottom_row_x = outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
-            bottom_row_y = outer_outline_size + border_size + inner_outline_size + (tilesize * board.height) + inner_outline_size + (border_size // 2) - (border_font_size // 2)
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
 
-            draw_horizontal_words(image,
-                                      x = bottom_row_x,
-                                      y = bottom_row_y,
-                                  words = generate_border_rows_text(board, options.border_uppercase),
-                                spacing = tilesize,
-                                   font = border_font,
-                              font_size = border_font_size,
-                             font_color = options.border_font_color)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
 
-            # border text, left column:
-            left_col_x = outer_outline_size + (border_size // 2)
-            left_col_y = outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
+    def send_text(self, status, text):
+        body = text.encode('utf-8')
 
-            draw_vertical_words(image,
-                                    x = left_col_x,
-                                    y = left_col_y,
-                                words = generate_border_cols_text(board),
-                              spacing = tilesize,
-                                 font = border_font,
-                            font_size = border_font_size,
-                           font_color = options.border_font_color)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-            # border text, right column:
-            right_col_x = outer_outline_size + border_size + inner_outline_size + (tilesize * board.width) + inner_outline_size + (border_size // 2)
-            right_col_y = outer_outline_size + border_size + inner_outline_size + (tilesize // 2)
 
-            draw_vertical_words(image,
-                                    x = right_col_x,
-                                    y = right_col_y,
-                                words = generate_border_cols_text(board),
-                              spacing = tilesize,
-                                 font = border_font,
-                            font_size = border_font_size,
-                           font_color = options.border_font_color)
+def make_server(options):
+    """ Create a (not yet running) render server for options.serve. """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-        # inner outline:
-        if not options.inner_outline_disable:
-            draw_rectangle_outline(image,
-                                      x1 = outer_outline_size + border_size,
-                                      y1 = outer_outline_size + border_size,
-                                      x2 = image.width - outer_outline_size - border_size - 1,
-                                      y2 = image.height - outer_outline_size - border_size - 1,
-                                   width = inner_outline_size - 1,
-                                   color = options.inner_outline_color)
-
-        # checkerboard holes:
-        if not options.checkerboard_disable and not options.checkerboard_holes_disable:
-            draw_checkerboard_holes(image,
-                                        x = outer_outline_size + border_size + inner_outline_size,
-                                        y = outer_outline_size + border_size + inner_outline_size,
-                                    board = board,
-                                 tilesize = tilesize,
-                                    color = options.checkerboard_color0)
-
-        # checkerboard pattern:
-        if not options.checkerboard_disable:
-            draw_checkerboard_pattern(image,
-                                          x = outer_outline_size + border_size + inner_outline_size,
-                                          y = outer_outline_size + border_size + inner_outline_size,
-                                      board = board,
-                                   tilesize = tilesize,
-                                     color1 = options.checkerboard_color1,
-                                     color2 = options.checkerboard_color2)
-
-        # crosses:
-        if not options.crosses_disable:
-            draw_marks(image,
-                           x = outer_outline_size + border_size + inner_outline_size,
-                           y = outer_outline_size + border_size + inner_outline_size,
-                       board = board,
-                    tilesize = tilesize,
-                      coords = options.crosses,
-                       color = options.crosses_color,
-            drawing_function = draw_cross_tile)
-
-        # dots:
-        if not options.dots_disable:
-            draw_marks(image,
-                           x = outer_outline_size + border_size + inner_outline_size,
-                           y = outer_outline_size + border_size + inner_outline_size,
-                       board = board,
-                    tilesize = tilesize,
-                      coords = options.dots,
-                       color = options.dots_color,
-            drawing_function = draw_dot_tile)
-
-        # tileset:
-        if not options.tileset_disable:
-            draw_pieces(image,
-                            x = outer_outline_size + border_size + inner_outline_size,
-                            y = outer_outline_size + border_size + inner_outline_size,
-                        board = board,
-                     tilesize = tilesize,
-                      tileset = tileset)
-
-        # save to disk:
-        image.save(options.filepath)
+    host, port = parse_server_address(options.serve)
+    handler = type('RenderRequestHandler', (RenderRequestHandler, BaseHTTPRequestHandler), {})
+
+    server = ThreadingHTTPServer((host, port), handler)
+    server.service = RenderService(options)
+
+    return server
+
+
+def run_server(options):
+    """ Serve render requests until interrupted. """
+    server = make_server(options)
+    outln('Serving on: {}:{}'.format(*server.server_address[:2]))
+
+    try:
+        server.serve_forever()
+
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+# Entry point:
+
+def main():
+    parser = make_parser()
+    options = parser.parse_args()
+    status = 0
+
+    if (options.batch is None and options.build is None and options.serve is None and options.pack_tileset is None
+            and (options.position is None or options.filepath is None)):
+        parser.error('the following arguments are required: position, filepath')
+
+    try:
+        if options.serve is not None:
+            run_server(options)
+
+        elif options.batch is not None:
+            if run_batch(options) > 0:
+                status = 1
+
+        elif options.build is not None:
+            if run_build(options) > 0:
+                status = 1
+
+        elif options.pack_tileset is not None:
+            sizes, tiles = pack_tileset(*options.pack_tileset)
+            outln('Packed {} tiles in {} sizes: {}'.format(tiles, sizes, options.pack_tileset[1]))
+
+        elif options.encoder_benchmark:
+            run_encoder_benchmark(options)
+
+        else:
+            Renderer().save_options(options)
 
     except TileboardError as err:
         errln('{}'.format(err))
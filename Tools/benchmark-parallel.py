@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Tileboard --parallel rendering.
+Draws the same board using 1..N processes, checks that every result
+is byte-identical to the serial one and prints the speedup.
+"""
+
+
+import argparse
+import os
+import sys
+import time
+
+from argparse import ArgumentParser
+
+
+# Tileboard itself (relative path) and its resources:
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Source')
+
+sys.path.insert(0, SOURCE)
+import Tileboard
+
+
+def make_parser():
+    parser = ArgumentParser(
+        description = __doc__,
+        formatter_class = lambda prog: argparse.HelpFormatter(prog, max_help_position = 50),
+    )
+
+    parser.add_argument('--position',
+        help = 'board position in (extended) FEN notation',
+        default = '/'.join(['rnbqkbnr', 'pppppppp'] + ['8'] * 4 + ['PPPPPPPP', 'RNBQKBNR']),
+        metavar = 'position', type = str)
+
+    parser.add_argument('--tileset-folder',
+        help = 'folder to look for piece tiles',
+        default = 'Tiles/alpha/300', metavar = 'folder', type = str)
+
+    parser.add_argument('--processes',
+        help = 'maximum number of processes (default: all the cores)',
+        default = os.cpu_count(), metavar = 'int', type = int)
+
+    parser.add_argument('--repeat',
+        help = 'renders per measure, the best time is used (default: 3)',
+        default = 3, metavar = 'int', type = int)
+
+    return parser
+
+
+def measure(renderer, options, processes, repeat):
+    """ Return (best time, image bytes) for rendering with 'processes'. """
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = renderer.render(options.position,
+            tileset_folder = options.tileset_folder,
+            parallel = processes)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, image.tobytes()
+
+
+def main():
+    options = make_parser().parse_args()
+
+    # tileset and font paths are relative to the Source folder:
+    os.chdir(SOURCE)
+    renderer = Tileboard.Renderer()
+
+    serial_time, serial_bytes = measure(renderer, options, 1, options.repeat)
+    print('processes  time (s)  speedup  identical')
+    print('{:>9}  {:>8.3f}  {:>7.2f}  {:>9}'.format(1, serial_time, 1.0, 'yes'))
+
+    for processes in range(2, options.processes + 1):
+        elapsed, data = measure(renderer, options, processes, options.repeat)
+        identical = 'yes' if data == serial_bytes else 'NO'
+
+        print('{:>9}  {:>8.3f}  {:>7.2f}  {:>9}'.format(processes, elapsed, serial_time / elapsed, identical))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark Tileboard over the shipped tilesets, board sizes, tile sizes,
+piece densities, marks and border/outline toggles.
+
+Every case is rendered in a new process, measuring the best time and the
+peak memory. Results are compared against a stored baseline: cases that
+are slower or use more memory than the thresholds allow are reported as
+regressions and the rendered pixels must be identical. The pixels are also
+compared against the shipped golden hashes, made by the original renderer
+(the first commit) for every case it can draw. It can't load tileset roots,
+so the tilesize-* cases on Tiles/merida have no golden hash.
+Saved RGB and P canvases must also peak below the same board in RGBA.
+"""
+
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+
+# Tileboard itself (relative path) and its resources:
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Source')
+
+sys.path.insert(0, SOURCE)
+import Tileboard
+
+
+# where baselines are stored by default:
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-baseline.json')
+
+# golden image hashes (shipped), see: --save-golden:
+DEFAULT_GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-golden.json')
+
+# the chess starting position:
+START = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR'
+
+PIECES = 'KQRBNPkqrbnp'
+
+# canvas modes compared by check_canvas_memory(), RGBA first:
+CANVAS_MODES = ('RGBA', 'RGB', 'P')
+
+
+# Positions:
+
+def compress_row(squares):
+    """
+    Replace runs of blank squares (' ') with digits, as in FEN,
+    or with numbers in braces (e.g. {19}) for long runs.
+    """
+    row = ''
+    blanks = 0
+
+    for square in squares + ['']:
+        if square == ' ':
+            blanks += 1
+            continue
+
+        if blanks > 0:
+            row += str(blanks) if blanks <= 9 else '{' + str(blanks) + '}'
+            blanks = 0
+
+        if square != ' ':
+            row += square
+
+    return row
+
+
+def is_hole(col, row, width, height):
+    """ True for squares in the cut-off corners of an irregular board. """
+    cut = min(width, height) // 4
+
+    distances = (col + row,
+                 (width - 1 - col) + row,
+                 col + (height - 1 - row),
+                 (width - 1 - col) + (height - 1 - row))
+
+    return min(distances) < cut
+
+
+def make_position(width, height, density, seed = 0, holes = False):
+    """
+    Return an extended FEN position with random pieces on about
+    'density' (0.0 to 1.0) of the squares, optionally with holes.
+    """
+    generator = random.Random(seed)
+    rows = []
+
+    for row in range(height):
+        squares = []
+
+        for col in range(width):
+            if holes and is_hole(col, row, width, height):
+                squares.append('0')
+
+            elif generator.random() < density:
+                squares.append(generator.choice(PIECES))
+
+            else:
+                squares.append(' ')
+
+        rows.append(compress_row(squares))
+
+    return '/'.join(rows)
+
+
+def make_marks(width, height, count, seed = 0):
+    """ Return 'count' distinct random square coordinates (e.g. 'a1'). """
+    generator = random.Random(seed)
+    squares = generator.sample(range(width * height), min(count, width * height))
+
+    return [Tileboard.to_base26(square % width) + str((square // width) + 1) for square in squares]
+
+
+# Cases:
+
+def make_cases():
+    """
+    Return a list of (name, position, options, huge, saved) cases.
+    Each group changes one thing from a small base case.
+    Huge cases are only run when asked. Saved cases are written
+    as PNG files, measuring encoding too.
+    """
+    cases = []
+
+    def add(name, position, huge = False, saved = False, **options):
+        cases.append((name, position, options, huge, saved))
+
+    # shipped tilesets:
+    for tileset in ('merida', 'alpha', 'usf'):
+        add('tileset-{}'.format(tileset), START, tileset_folder = 'Tiles/{}/42'.format(tileset))
+
+    # tile sizes, resampled when not shipped (1000 px is synthetic):
+    for size in (20, 42, 100, 300):
+        add('tilesize-{}'.format(size), START, tileset_folder = 'Tiles/merida', tileset_size = size)
+
+    add('tilesize-1000-blank', '8/8/8/8/8/8/8/8', huge = True, tileset_size = 1000)
+    add('tilesize-1000', START, huge = True, tileset_folder = 'Tiles/merida', tileset_size = 1000)
+
+    # board dimensions:
+    for size in (8, 32, 128):
+        add('board-{0}x{0}'.format(size), make_position(size, size, 0.5), tileset_folder = 'Tiles/alpha/20')
+
+    add('board-512x512', make_position(512, 512, 0.5), huge = True, tileset_folder = 'Tiles/alpha/20')
+    add('board-96x24', make_position(96, 24, 0.5), tileset_folder = 'Tiles/alpha/20')
+    add('holes-64x64', make_position(64, 64, 0.5, holes = True), tileset_folder = 'Tiles/alpha/20')
+
+    # sparse boards, few pieces:
+    add('sparse-128x128', make_position(128, 128, 0.01), tileset_folder = 'Tiles/alpha/20')
+    add('sparse-512x512', make_position(512, 512, 0.001), huge = True, tileset_folder = 'Tiles/alpha/20')
+
+    # piece density:
+    for density in (0, 25, 100):
+        add('density-{}'.format(density), make_position(64, 64, density / 100), tileset_folder = 'Tiles/merida/42')
+
+    # marks:
+    position = make_position(64, 64, 0.25)
+
+    add('marks-100', position, tileset_folder = 'Tiles/merida/42',
+        crosses = make_marks(64, 64, 100, seed = 1),
+        dots = make_marks(64, 64, 100, seed = 2))
+
+    add('marks-all', position, tileset_folder = 'Tiles/merida/42',
+        dots = make_marks(64, 64, 64 * 64))
+
+    # border and outline toggles:
+    position = make_position(32, 32, 0.5)
+
+    add('toggles-default', position, tileset_folder = 'Tiles/merida/42')
+    add('toggles-no-border', position, tileset_folder = 'Tiles/merida/42', border_disable = True)
+
+    add('toggles-no-outlines', position, tileset_folder = 'Tiles/merida/42',
+        outer_outline_disable = True,
+        inner_outline_disable = True)
+
+    add('toggles-bare', position, tileset_folder = 'Tiles/merida/42',
+        border_disable = True,
+        outer_outline_disable = True,
+        inner_outline_disable = True,
+        checkerboard_disable = True)
+
+    # canvas modes, saved (see: check_canvas_memory()):
+    for mode in CANVAS_MODES:
+        add('canvas-{}'.format(mode.lower()), '8/8/8/8/8/8/8/8', saved = True,
+            tileset_size = 400, canvas_mode = mode)
+
+        add('canvas-{}-1000'.format(mode.lower()), '8/8/8/8/8/8/8/8', huge = True, saved = True,
+            tileset_size = 1000, canvas_mode = mode)
+
+    return cases
+
+
+# Measuring:
+
+def run_case(job):
+    """
+    Render a case 'repeat' times (in a new process) and return
+    (name, best time, peak memory, image hash).
+    Each render uses a new Renderer, the tiles stay cached.
+    """
+    (name, position, options, huge, saved), repeat, resample_folder = job
+    filepath = os.path.join(resample_folder, name + '.png')
+    best = None
+
+    for _ in range(repeat):
+        renderer = Tileboard.Renderer(tileset_resample_folder = resample_folder, **options)
+
+        start = time.perf_counter()
+
+        if saved:
+            renderer.save(position, filepath)
+        else:
+            image = renderer.render(position)
+
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # the peak before reading saved images back:
+    peak = Tileboard.peak_rss()
+
+    if saved:
+        image = Tileboard.Image.open(filepath)
+        image.load()
+        os.remove(filepath)
+
+    digest = hashlib.sha256(image.tobytes()).hexdigest()
+    digest = '{}:{}x{}:{}'.format(image.mode, image.width, image.height, digest)
+
+    return name, best, peak, digest
+
+
+# Baselines:
+
+def load_baseline(filepath):
+    """ Return the cases in a baseline file (name -> result) or None when missing. """
+    if not os.path.isfile(filepath):
+        return None
+
+    with open(filepath, 'r', encoding = 'utf-8') as descriptor:
+        return json.load(descriptor)['cases']
+
+
+def save_baseline(filepath, results):
+    """ Write results (name -> result) as a baseline file. """
+    baseline = {
+        'python': platform.python_version(),
+        'pillow': Tileboard.Image.__version__,
+        'machine': platform.machine(),
+        'cases': results,
+    }
+
+    with open(filepath, 'w', encoding = 'utf-8') as descriptor:
+        json.dump(baseline, descriptor, indent = 4, sort_keys = True)
+        descriptor.write('\n')
+
+
+def load_golden(filepath):
+    """ Return the golden hashes in a file (name -> hash) or an empty dict when missing. """
+    if not os.path.isfile(filepath):
+        return {}
+
+    with open(filepath, 'r', encoding = 'utf-8') as descriptor:
+        return json.load(descriptor)['cases']
+
+
+def save_golden(filepath, golden):
+    """ Write golden hashes (name -> hash). """
+    with open(filepath, 'w', encoding = 'utf-8') as descriptor:
+        json.dump({ 'cases': golden }, descriptor, indent = 4, sort_keys = True)
+        descriptor.write('\n')
+
+
+def compare(result, base, time_threshold, time_slack, memory_threshold):
+    """
+    Return a list of problems of a result compared to its baseline.
+    Time differences under 'time_slack' seconds are ignored (noise).
+    """
+    problems = []
+
+    if result['hash'] != base['hash']:
+        problems.append('pixels differ')
+
+    if result['time'] > max(base['time'] * (1 + time_threshold), base['time'] + time_slack):
+        problems.append('slower')
+
+    if result['peak_rss'] is not None and base['peak_rss'] is not None:
+        if result['peak_rss'] > base['peak_rss'] * (1 + memory_threshold):
+            problems.append('more memory')
+
+    return problems
+
+
+def check_canvas_memory(results):
+    """
+    Return a list of (name, problem) for canvas-* cases whose
+    RGB or P canvas doesn't peak below the same case in RGBA.
+    """
+    problems = []
+
+    for name, result in sorted(results.items()):
+        match = re.match('canvas-(rgb|p)(.*)$', name)
+
+        if match is None:
+            continue
+
+        rgba = results.get('canvas-rgba' + match.group(2))
+
+        if rgba is None or rgba['peak_rss'] is None or result['peak_rss'] is None:
+            continue
+
+        if result['peak_rss'] >= rgba['peak_rss']:
+            problems.append((name, 'peak memory not below canvas-rgba' + match.group(2)))
+
+    return problems
+
+
+# Entry point:
+
+def make_parser():
+    parser = ArgumentParser(
+        description = __doc__,
+        formatter_class = lambda prog: argparse.HelpFormatter(prog, max_help_position = 50),
+    )
+
+    parser.add_argument('--filter',
+        help = 'only run the cases whose name matches this regular expression',
+        default = None, metavar = 'regex', type = str)
+
+    parser.add_argument('--huge',
+        help = 'also run the huge cases (1000 px tiles, 512x512 boards)',
+        action = 'store_true')
+
+    parser.add_argument('--list',
+        help = 'list the cases and exit',
+        action = 'store_true')
+
+    parser.add_argument('--repeat',
+        help = 'renders per case, the best time is used (default: 3)',
+        default = 3, metavar = 'int', type = int)
+
+    parser.add_argument('--baseline',
+        help = 'baseline file to compare against (default: Tools/benchmark-baseline.json)',
+        default = DEFAULT_BASELINE, metavar = 'filepath', type = str)
+
+    parser.add_argument('--save-baseline',
+        help = 'store the results as the new baseline instead of comparing',
+        action = 'store_true')
+
+    parser.add_argument('--golden',
+        help = 'golden hashes to compare the pixels against (default: Tools/benchmark-golden.json)',
+        default = DEFAULT_GOLDEN, metavar = 'filepath', type = str)
+
+    parser.add_argument('--save-golden',
+        help = 'store the image hashes as the new golden hashes (only when pixels change on purpose)',
+        action = 'store_true')
+
+    parser.add_argument('--time-threshold',
+        help = 'fraction of extra time that is a regression (default: 0.25)',
+        default = 0.25, metavar = 'float', type = float)
+
+    parser.add_argument('--time-slack',
+        help = 'seconds of extra time that are never a regression (default: 0.01)',
+        default = 0.01, metavar = 'float', type = float)
+
+    parser.add_argument('--memory-threshold',
+        help = 'fraction of extra peak memory that is a regression (default: 0.25)',
+        default = 0.25, metavar = 'float', type = float)
+
+    return parser
+
+
+def main():
+    options = make_parser().parse_args()
+
+    cases = [case for case in make_cases()
+        if (options.huge or not case[3])
+        and (options.filter is None or re.search(options.filter, case[0]))]
+
+    if options.list:
+        for name, position, case_options, huge, saved in cases:
+            print(name)
+        return 0
+
+    # tileset and font paths are relative to the Source folder:
+    baseline_path = os.path.abspath(options.baseline)
+    golden_path = os.path.abspath(options.golden)
+    os.chdir(SOURCE)
+
+    Tileboard.import_pillow()
+
+    baseline = None if options.save_baseline else load_baseline(baseline_path)
+    golden = {} if options.save_golden else load_golden(golden_path)
+    results = {}
+    failures = 0
+
+    print('{:<24} {:>10} {:>10} {:>10}  {}'.format('case', 'time (s)', 'peak (MB)', 'vs base', 'status'))
+
+    with tempfile.TemporaryDirectory() as resample_folder:
+        jobs = [(case, options.repeat, resample_folder) for case in cases]
+
+        # a new process for every case, so that peak memory is per case:
+        with multiprocessing.Pool(1, maxtasksperchild = 1) as pool:
+            for name, elapsed, peak, digest in pool.imap(run_case, jobs, chunksize = 1):
+                result = { 'time': elapsed, 'peak_rss': peak, 'hash': digest }
+                results[name] = result
+
+                change = ''
+                status = 'ok'
+                problems = []
+
+                if name in golden and digest != golden[name]:
+                    problems.append('pixels differ from golden')
+
+                if baseline is not None and name in baseline:
+                    base = baseline[name]
+                    change = '{:+.1%}'.format((elapsed - base['time']) / base['time'])
+                    problems.extend(compare(result, base, options.time_threshold, options.time_slack, options.memory_threshold))
+
+                elif baseline is not None:
+                    status = 'new'
+
+                if len(problems) > 0:
+                    status = 'FAIL: ' + ', '.join(problems)
+                    failures += 1
+
+                peak_mb = '-' if peak is None else '{:.1f}'.format(peak / (1024 * 1024))
+                print('{:<24} {:>10.3f} {:>10} {:>10}  {}'.format(name, elapsed, peak_mb, change, status), flush = True)
+
+    for name, problem in check_canvas_memory(results):
+        print('{:<24} FAIL: {}'.format(name, problem))
+        failures += 1
+
+    if options.save_golden:
+        # keep the cases that weren't run this time:
+        previous = load_golden(golden_path)
+        previous.update((name, result['hash']) for name, result in results.items())
+
+        save_golden(golden_path, previous)
+        print('golden hashes saved: {}'.format(golden_path))
+
+    if options.save_baseline:
+        # keep the cases that weren't run this time:
+        previous = load_baseline(baseline_path) or {}
+        previous.update(results)
+
+        save_baseline(baseline_path, previous)
+        print('baseline saved: {}'.format(baseline_path))
+
+    elif baseline is None:
+        print('no baseline to compare against, see: --save-baseline')
+
+    return 1 if failures > 0 else 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        pass